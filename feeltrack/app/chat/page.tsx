@@ -96,8 +96,11 @@ export default function ChatPage() {
       content: input,
     };
   
+    const botMessageId = messages.length + 2
+    setMessages((prevMessages) => [...prevMessages, { id: botMessageId, text: "", sender: "bot" }])
+
     try {
-      const response = await fetch('http://localhost:8001/conversations/message', {
+      const response = await fetch('http://localhost:8001/conversations/message/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -105,21 +108,34 @@ export default function ChatPage() {
         body: JSON.stringify(mg),
       });
   
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Network response was not ok');
       }
 
-  
-      const data = await response.json();
-      const res=data[data.length-1].content
-      
-      const newBotMessage: Message = {
-        id: messages.length + 2,
-        text: res,
-        sender: "bot",
+      // Read the Server-Sent Events stream and append tokens as they arrive
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split("\n\n")
+        buffer = events.pop() ?? ""
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1]
+          const data = raw.match(/^data: (.*)$/m)?.[1]
+          if (!event || !data) continue
+          const payload = JSON.parse(data)
+          if (event === "token") {
+            setMessages((prevMessages) =>
+              prevMessages.map((m) => (m.id === botMessageId ? { ...m, text: m.text + payload.text } : m)),
+            )
+          } else if (event === "done") {
+            console.log("Received from backend:", payload);
+          }
+        }
       }
-      setMessages((prevMessages) => [...prevMessages, newBotMessage])
-      console.log("Received from backend:", data);
     } catch (error) {
       console.error("Fetch error:", error);
     }
@@ -24,8 +24,24 @@ export default function CheckInPage() {
   const [notes, setNotes] = useState("")
   const [submitted, setSubmitted] = useState(false)
 
-  const handleSubmit = () => {
+  const handleSubmit = async () => {
     if (selectedEmotion !== null) {
+      try {
+        const response = await fetch("http://localhost:8001/users/1/check-ins", { // replace with actual user ID
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify({ emotion: emotions[selectedEmotion].label, notes: notes || null }),
+        })
+        if (!response.ok) {
+          throw new Error("Network response was not ok")
+        }
+      } catch (error) {
+        console.error("Check-in error:", error)
+        return
+      }
+
       setSubmitted(true)
 
       // Reset after showing thank you message
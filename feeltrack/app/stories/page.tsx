@@ -35,25 +35,43 @@ export default function Stories() {
   };
   const [isHovered, setIsHovered] = useState(false);
 
+  const [generatedImages, setGeneratedImages] = useState<Record<number, string>>({});
+  const [generating, setGenerating] = useState(false);
+
   const handleClick = async() => {
+    const slide = slides[currentSlide];
+    if (generating || generatedImages[slide.id]) return;
+    setGenerating(true);
     try {
-      const response = await fetch('http://localhost:8001/gen_image', {
-        method: 'GET',
+      // Queue the job, then long-poll until the image is ready
+      let response = await fetch('http://localhost:8001/generate-image', {
+        method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        
+        body: JSON.stringify({ theme: slide.text, story_id: slide.id }),
       });
-  
       if (!response.ok) {
         throw new Error('Network response was not ok');
       }
-  
-      const data = await response.json();
-    
-      console.log("Received from backend:", data);
+      let job = await response.json();
+
+      while (job.status === 'queued' || job.status === 'running') {
+        response = await fetch(`http://localhost:8001/image-jobs/${job.job_id}?wait=25`);
+        if (!response.ok) {
+          throw new Error('Network response was not ok');
+        }
+        job = await response.json();
+      }
+
+      if (job.status !== 'done') {
+        throw new Error(job.error || 'Image generation failed');
+      }
+      setGeneratedImages((prev) => ({ ...prev, [slide.id]: `http://localhost:8001${job.image_url}` }));
     } catch (error) {
       console.error("Fetch error:", error);
+    } finally {
+      setGenerating(false);
     }
   };
   return (
@@ -98,11 +116,11 @@ export default function Stories() {
         <div className="mb-4 md:mb-0 md:mr-6">
         {isHovered && (
             <div className="absolute top-1/2 left-full ml-3 transform -translate-y-1/2 bg-gray-800 text-white text-sm px-3 py-1 rounded shadow-lg z-10">
-          <p>Wanna see your story as art?</p>
+          <p>{generating ? 'Painting your story...' : 'Wanna see your story as art?'}</p>
         </div>
       )}
           <Image
-            src={slides[currentSlide].image}
+            src={generatedImages[slides[currentSlide].id] || slides[currentSlide].image}
             alt="Picture vibes"
             width={500}
             height={500}
@@ -1,5 +1,6 @@
 "use client"
 
+import { useEffect, useState } from "react"
 import { Button } from "@/components/ui/button"
 import { Card, CardContent } from "@/components/ui/card"
 import { ArrowLeft } from "lucide-react"
@@ -7,28 +8,55 @@ import Link from "next/link"
 import { ChartContainer, ChartTooltip, ChartTooltipContent, ChartLegend, ChartLegendItem } from "@/components/ui/chart"
 import { Area, AreaChart, XAxis, YAxis, CartesianGrid, ResponsiveContainer, PieChart, Pie, Cell } from "recharts"
 
-// Mock data for the weekly mood chart
-const weeklyMoodData = [
-  { day: "Mon", value: 3, mood: "Neutral" },
-  { day: "Tue", value: 2, mood: "Sad" },
-  { day: "Wed", value: 4, mood: "Happy" },
-  { day: "Thu", value: 3, mood: "Neutral" },
-  { day: "Fri", value: 5, mood: "Very Happy" },
-  { day: "Sat", value: 4, mood: "Happy" },
-  { day: "Sun", value: 4, mood: "Happy" },
-]
+const moodLabels = ["Very Sad", "Sad", "Neutral", "Happy", "Very Happy"]
 
-// Mock data for the emotion distribution
-const emotionData = [
-  { name: "Happy", value: 3, color: "#FFD166" },
-  { name: "Calm", value: 2, color: "#06D6A0" },
-  { name: "Neutral", value: 1, color: "#118AB2" },
-  { name: "Sad", value: 1, color: "#073B4C" },
-]
+const emotionColors: Record<string, string> = {
+  Happy: "#FFD166",
+  Calm: "#06D6A0",
+  Neutral: "#118AB2",
+  Confused: "#9B5DE5",
+  Sad: "#073B4C",
+  Angry: "#EF476F",
+  Anxious: "#2EC4B6",
+  Tired: "#8D99AE",
+}
+
+type WeeklyWrap = {
+  days: { weekday: string; check_ins: number; average_mood: number | null }[]
+  emotions: { emotion: string; count: number }[]
+  days_checked_in: number
+}
 
 export default function WeeklyWrapPage() {
-  // Calculate most frequent emotion
-  const mostFrequentEmotion = emotionData.reduce((prev, current) => (prev.value > current.value ? prev : current))
+  const [wrap, setWrap] = useState<WeeklyWrap | null>(null)
+
+  useEffect(() => {
+    // replace with actual user ID
+    fetch("http://localhost:8001/users/1/check-ins/weekly")
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error("Network response was not ok")
+        }
+        return response.json()
+      })
+      .then(setWrap)
+      .catch((error) => console.error("Weekly wrap error:", error))
+  }, [])
+
+  const weeklyMoodData = (wrap?.days ?? []).map((day) => ({
+    day: day.weekday,
+    value: day.average_mood,
+    mood: day.average_mood === null ? "No check-in" : moodLabels[Math.round(day.average_mood) - 1],
+  }))
+
+  const emotionData = (wrap?.emotions ?? []).map((item) => ({
+    name: item.emotion,
+    value: item.count,
+    color: emotionColors[item.emotion] ?? "#CBD5E1",
+  }))
+
+  // Emotions come back most frequent first
+  const mostFrequentEmotion = emotionData[0]
 
   return (
     <main className="flex flex-col min-h-screen bg-gradient-to-b from-rose-50 to-blue-50 p-4 pb-20">
@@ -61,10 +89,7 @@ export default function WeeklyWrapPage() {
                     ticks={[1, 2, 3, 4, 5]}
                     tick={{ fontSize: 12, fill: "#6B7280" }}
                     tickLine={false}
-                    tickFormatter={(value) => {
-                      const labels = ["Very Sad", "Sad", "Neutral", "Happy", "Very Happy"]
-                      return labels[value - 1]
-                    }}
+                    tickFormatter={(value) => moodLabels[value - 1]}
                   />
                   <ChartTooltip
                     content={
@@ -152,12 +177,12 @@ export default function WeeklyWrapPage() {
               <div className="p-3 bg-rose-100 rounded-lg">
                 <p className="text-sm font-medium text-rose-700">Most frequent emotion</p>
                 <p className="text-lg">
-                  {mostFrequentEmotion.name} ({mostFrequentEmotion.value} times)
+                  {mostFrequentEmotion ? `${mostFrequentEmotion.name} (${mostFrequentEmotion.value} times)` : "No check-ins yet"}
                 </p>
               </div>
               <div className="p-3 bg-blue-100 rounded-lg">
                 <p className="text-sm font-medium text-blue-700">Total check-ins</p>
-                <p className="text-lg">7 days completed</p>
+                <p className="text-lg">{wrap?.days_checked_in ?? 0} days completed</p>
               </div>
               <div className="p-3 bg-green-100 rounded-lg">
                 <p className="text-sm font-medium text-green-700">Quote of the week</p>
@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted. `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+# Token bucket stores. take() spends one token and returns 0, or returns the
+# seconds until a token will be available. Wall-clock time is used so that
+# workers sharing a store agree on refill.
+class MemoryBucketStore:
+    """Token buckets in process memory; the least recently used are dropped past `max_keys`."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key: str, rate: float, capacity: int, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBucketStore:
+    """Token buckets in a local SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str, prune_after: float = 3600):
+        self.path = path
+        self.prune_after = prune_after
+        self._local = threading.local()
+        self._calls = 0
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, capacity: int, now: float) -> float:
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                # Idle buckets are full again anyway, so dropping them changes nothing
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.prune_after,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    """Per-user and global token buckets, checked before a request does any work."""
+
+    def __init__(self, store, user_rate_per_minute: float, user_burst: int,
+                 global_rate_per_minute: float, global_burst: int, shared: bool = False):
+        self.store = store
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.global_rate = global_rate_per_minute / 60.0
+        self.global_burst = global_burst
+        # A shared store does file I/O, so it is called off the event loop
+        self.shared = shared
+
+    def _take(self, user_id: int):
+        now = time.time()
+        wait = self.store.take(f"user:{user_id}", self.user_rate, self.user_burst, now)
+        if wait:
+            raise Rejected("Too many requests for this user", wait)
+        wait = self.store.take("global", self.global_rate, self.global_burst, now)
+        if wait:
+            raise Rejected("Server is at capacity", wait)
+
+    async def check(self, user_id: int):
+        if self.shared:
+            await asyncio.get_running_loop().run_in_executor(None, self._take, user_id)
+        else:
+            self._take(user_id)
+
+
+class Lane:
+    """A class of work: lower `priority` is served first, `max_slots` caps its share,
+    and `max_wait` (seconds, None for no limit) is how long it may queue."""
+
+    def __init__(self, priority: int, max_slots: int, max_wait: float = None):
+        self.priority = priority
+        self.max_slots = max_slots
+        self.max_wait = max_wait
+        self.in_use = 0
+
+
+class Ticket:
+    """A granted slot. release() is idempotent."""
+
+    def __init__(self, limiter, lane: Lane):
+        self._limiter = limiter
+        self._lane = lane
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self._lane, time.monotonic() - self._start)
+
+
+class PriorityLimiter:
+    """Concurrency slots handed out by lane priority, with a bounded, deadline-aware queue.
+
+    A request that cannot run at once joins the queue, unless the queue is full
+    or the estimated wait (from the average time a slot is held) is already
+    past its lane's deadline; those are shed straight away with a Retry-After
+    hint. A queued request is shed when its deadline passes. Freed slots go to
+    the highest-priority waiter whose lane is under its cap.
+    """
+
+    def __init__(self, slots: int, max_queued: int, lanes: dict):
+        self.slots = slots
+        self.max_queued = max_queued
+        self.lanes = lanes
+        self.in_use = 0
+        self.avg_hold = 1.0
+        self.admitted = 0
+        self.shed = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _can_run(self, lane: Lane):
+        return self.in_use < self.slots and lane.in_use < lane.max_slots
+
+    def _grant(self, lane: Lane) -> Ticket:
+        self.in_use += 1
+        lane.in_use += 1
+        self.admitted += 1
+        return Ticket(self, lane)
+
+    def _release(self, lane: Lane, held: float):
+        self.in_use -= 1
+        lane.in_use -= 1
+        self.avg_hold = 0.9 * self.avg_hold + 0.1 * held
+        self._dispatch()
+
+    def _dispatch(self):
+        blocked = []
+        while self._waiters and self.in_use < self.slots:
+            entry = heapq.heappop(self._waiters)
+            _, _, lane, future = entry
+            if future.done():
+                continue
+            if lane.in_use >= lane.max_slots:
+                blocked.append(entry)
+                continue
+            future.set_result(self._grant(lane))
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+
+    def _reject(self, reason: str, retry_after: float):
+        self.shed += 1
+        raise Rejected(reason, retry_after)
+
+    async def acquire(self, lane_name: str) -> Ticket:
+        lane = self.lanes[lane_name]
+        waiting = [entry for entry in self._waiters if not entry[3].done()]
+        ahead = sum(1 for entry in waiting if entry[0] <= lane.priority)
+        if not ahead and self._can_run(lane):
+            return self._grant(lane)
+
+        estimate = (ahead + 1) * self.avg_hold / max(1, min(self.slots, lane.max_slots))
+        if len(waiting) >= self.max_queued:
+            self._reject("Server is busy, queue is full", estimate)
+        if lane.max_wait is not None and estimate > lane.max_wait:
+            self._reject("Server is busy", estimate)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (lane.priority, next(self._seq), lane, future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            return await asyncio.wait_for(future, lane.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait ended; hand the slot straight back
+                future.result().release()
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("Server is busy, request timed out in queue", self.avg_hold)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, lane_name: str):
+        ticket = await self.acquire(lane_name)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self):
+        """Slot usage and admission counters for monitoring."""
+        return {
+            "slots": self.slots,
+            "in_use": self.in_use,
+            "queued": sum(1 for entry in self._waiters if not entry[3].done()),
+            "lanes": {name: lane.in_use for name, lane in self.lanes.items()},
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_hold_s": round(self.avg_hold, 3),
+        }
@@ -0,0 +1,75 @@
+import asyncio
+import random
+from types import SimpleNamespace
+from google.api_core import exceptions as google_exceptions
+
+# Set by install(); shared by every fake model instance
+settings = {"latency": 0.5, "jitter": 0.2, "failure_rate": 0.0, "chunks": 8, "embedding_dim": 768}
+
+CANNED_REPLY = (
+    "That sounds like a lot to carry. It makes sense that you feel this way, and it is "
+    "okay to take things one step at a time. What would feel most supportive right now?"
+)
+
+
+async def _simulate_call():
+    delay = max(0.0, random.gauss(settings["latency"], settings["jitter"]))
+    await asyncio.sleep(delay)
+    if random.random() < settings["failure_rate"]:
+        raise google_exceptions.ServiceUnavailable("fake Gemini failure")
+
+
+class FakeStream:
+    """Async iterable of response chunks, like a streamed Gemini response."""
+
+    def __init__(self, text: str, chunks: int):
+        size = max(1, len(text) // chunks)
+        self._parts = [text[i:i + size] for i in range(0, len(text), size)]
+
+    async def __aiter__(self):
+        for part in self._parts:
+            await asyncio.sleep(settings["latency"] / len(self._parts))
+            yield SimpleNamespace(text=part)
+
+
+class FakeChatSession:
+    def __init__(self, history):
+        self.history = history
+
+    async def send_message_async(self, prompt, stream=False):
+        if stream:
+            if random.random() < settings["failure_rate"]:
+                raise google_exceptions.ServiceUnavailable("fake Gemini failure")
+            return FakeStream(CANNED_REPLY, settings["chunks"])
+        await _simulate_call()
+        return SimpleNamespace(text=CANNED_REPLY)
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel with configurable latency and failure rate."""
+
+    def __init__(self, model_name, *args, **kwargs):
+        self.model_name = model_name
+
+    def start_chat(self, history=None):
+        return FakeChatSession(history or [])
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await _simulate_call()
+        return SimpleNamespace(text=f"A gentle reframe ({len(prompt)} chars of context).")
+
+
+def fake_embed_content(model, content, task_type=None, **kwargs):
+    """Deterministic pseudo-embedding so the search index has vectors to store."""
+    rng = random.Random(content)
+    return {"embedding": [rng.uniform(-1, 1) for _ in range(settings["embedding_dim"])]}
+
+
+def install(latency: float, jitter: float, failure_rate: float):
+    """Replace the Gemini SDK entry points the app uses with the fake."""
+    import google.generativeai as genai
+
+    settings.update(latency=latency, jitter=jitter, failure_rate=failure_rate)
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.embed_content = fake_embed_content
@@ -0,0 +1,47 @@
+"""Disposable MySQL server in Docker, used as the benchmark's database stand-in."""
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+IMAGE = os.getenv("BENCH_MYSQL_IMAGE", "mysql:8.0")
+PASSWORD = "bench"
+
+
+def start(port: int = 33306):
+    """Start a throwaway MySQL container and return (container_name, db_env)."""
+    name = f"feeltrack-bench-{uuid.uuid4().hex[:8]}"
+    subprocess.run(
+        ["docker", "run", "-d", "--rm", "--name", name, "-p", f"{port}:3306",
+         "-e", f"MYSQL_ROOT_PASSWORD={PASSWORD}", IMAGE],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    env = {"DB_HOST": "127.0.0.1", "DB_PORT": str(port), "DB_USER": "root",
+           "DB_PASSWORD": PASSWORD, "DB_NAME": "mentalhealthdb"}
+    _wait_until_ready(name)
+    return name, env
+
+
+def _wait_until_ready(name: str, timeout: float = 90):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready = subprocess.run(
+            ["docker", "exec", name, "mysql", "-uroot", f"-p{PASSWORD}", "-e", "SELECT 1"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if ready.returncode == 0:
+            return
+        time.sleep(1)
+    raise RuntimeError("MySQL container did not become ready in time")
+
+
+def setup_schema(env: dict):
+    """Create the tables and apply migrations using the repo's setup script."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "database-setup.py"], cwd=backend_dir,
+                   env={**os.environ, **env}, check=True)
+
+
+def stop(name: str):
+    subprocess.run(["docker", "stop", name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
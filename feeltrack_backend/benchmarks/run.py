@@ -0,0 +1,271 @@
+"""Load test for the API with a fake Gemini and a local MySQL stand-in.
+
+Starts the app (benchmarks/serve.py) against a fake Gemini, seeds users and
+conversations, replays a weighted traffic mix and reports p50/p95/p99 latency,
+requests per second and database wait per endpoint. With --baseline it exits
+non-zero when any endpoint regresses past the tolerance.
+
+Usage (from feeltrack_backend/):
+    python -m benchmarks.run --db docker --duration 30 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --db docker --duration 30 --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+from benchmarks import local_db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weight of each operation in the replayed traffic
+DEFAULT_MIX = {
+    "login": 5,
+    "send_message": 25,
+    "list_messages": 25,
+    "list_conversations": 10,
+    "get_preferences": 10,
+    "supportive_messages": 25,
+}
+
+SAMPLE_MESSAGES = [
+    "I'm tired",
+    "feeling anxious about work today",
+    "I had a good day actually",
+    "I can't sleep and my mind keeps racing",
+    "My friend didn't reply to me and I feel ignored",
+]
+
+
+class Recorder:
+    """Collects latency and database wait samples per endpoint."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.db_waits = {}
+        self.errors = {}
+        self.rejected = {}
+
+    def record(self, name, seconds, response):
+        if response.status_code == 429:
+            # Shed by admission control before doing any work; counted on its own so
+            # fast rejections do not pull down the latency percentiles
+            self.rejected[name] = self.rejected.get(name, 0) + 1
+            return
+        self.latencies.setdefault(name, []).append(seconds)
+        match = re.search(r"db-wait;dur=([\d.]+)", response.headers.get("server-timing", ""))
+        if match:
+            self.db_waits.setdefault(name, []).append(float(match.group(1)))
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed):
+        results = {}
+        for name in sorted(set(self.latencies) | set(self.rejected)):
+            samples = self.latencies.get(name, [])
+            ordered = sorted(samples)
+            waits = self.db_waits.get(name, [0.0])
+            results[name] = {
+                "count": len(samples),
+                "rps": len(samples) / elapsed,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "db_wait_avg_ms": statistics.mean(waits),
+                "db_wait_max_ms": max(waits),
+                "errors": self.errors.get(name, 0),
+                "rejected": self.rejected.get(name, 0),
+            }
+        return results
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def timed(client, recorder, name, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    recorder.record(name, time.perf_counter() - start, response)
+    return response
+
+
+async def seed_user(client):
+    """Register a user with one conversation and return its state for the traffic loop."""
+    username = f"bench_{uuid.uuid4().hex[:12]}"
+    password = "bench-password"
+    response = await client.post("/register", json={
+        "username": username, "email": f"{username}@example.com", "password": password
+    })
+    response.raise_for_status()
+    user_id = response.json()["user_id"]
+    response = await client.post(f"/users/{user_id}/conversations")
+    response.raise_for_status()
+    conversation_id = response.json()["conversation_id"]
+    return {"user_id": user_id, "username": username, "password": password,
+            "conversation_id": conversation_id}
+
+
+async def run_operation(client, recorder, name, user):
+    user_id = user["user_id"]
+    if name == "login":
+        await timed(client, recorder, name, "POST", "/login",
+                    json={"username": user["username"], "password": user["password"]})
+    elif name == "send_message":
+        await timed(client, recorder, name, "POST", "/conversations/message", json={
+            "user_id": user_id, "conversation_id": user["conversation_id"],
+            "content": random.choice(SAMPLE_MESSAGES)
+        })
+    elif name == "list_messages":
+        await timed(client, recorder, name, "GET", f"/conversations/{user['conversation_id']}/messages",
+                    params={"user_id": user_id})
+    elif name == "list_conversations":
+        await timed(client, recorder, name, "GET", f"/users/{user_id}/conversations")
+    elif name == "get_preferences":
+        await timed(client, recorder, name, "GET", f"/users/{user_id}/preferences")
+    elif name == "supportive_messages":
+        await timed(client, recorder, name, "GET", f"/users/{user_id}/supportive-messages")
+
+
+async def generate_load(base_url, users, concurrency, duration, mix, seed):
+    random.seed(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        accounts = await asyncio.gather(*(seed_user(client) for _ in range(users)))
+        deadline = time.monotonic() + duration
+
+        async def virtual_user(worker):
+            rng = random.Random(seed + worker)
+            while time.monotonic() < deadline:
+                name = rng.choices(names, weights)[0]
+                try:
+                    await run_operation(client, recorder, name, rng.choice(accounts))
+                except httpx.HTTPError:
+                    recorder.errors[name] = recorder.errors.get(name, 0) + 1
+
+        start = time.monotonic()
+        await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return recorder.report(elapsed), elapsed
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against a stored baseline."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']:.1f} -> {current['rps']:.1f}")
+    return regressions
+
+
+def print_report(results, elapsed):
+    header = (f"{'endpoint':<22}{'count':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'db wait':>10}"
+              f"{'errors':>8}{'429s':>7}")
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<22}{r['count']:>7}{r['rps']:>8.1f}{r['p50_ms']:>8.1f}m{r['p95_ms']:>8.1f}m"
+              f"{r['p99_ms']:>8.1f}m{r['db_wait_avg_ms']:>9.2f}m{r['errors']:>8}{r['rejected']:>7}")
+    total = sum(r["count"] for r in results.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("API server did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against fake Gemini and local MySQL")
+    parser.add_argument("--base-url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--db", choices=["env", "docker"], default="env",
+                        help="use the DB_* environment (env) or a disposable MySQL container (docker)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX,
+                        help='JSON weights, e.g. \'{"send_message": 1, "list_messages": 3}\'')
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="fail if results regress against this JSON file")
+    parser.add_argument("--save-baseline", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression fraction")
+    args = parser.parse_args()
+
+    container = None
+    server = None
+    base_url = args.base_url
+    try:
+        if not base_url:
+            env = dict(os.environ)
+            if args.db == "docker":
+                container, db_env = local_db.start()
+                env.update(db_env)
+                local_db.setup_schema(db_env)
+            server = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.serve", "--port", str(args.port),
+                 "--gemini-latency", str(args.gemini_latency),
+                 "--gemini-jitter", str(args.gemini_jitter),
+                 "--gemini-failure-rate", str(args.gemini_failure_rate)],
+                cwd=BACKEND_DIR, env=env
+            )
+            base_url = f"http://127.0.0.1:{args.port}"
+            wait_for_server(base_url)
+
+        results, elapsed = asyncio.run(generate_load(
+            base_url, args.users, args.concurrency, args.duration, args.mix, args.seed
+        ))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if container:
+            local_db.stop(container)
+
+    print_report(results, elapsed)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Run the API with a fake Gemini backend for benchmarking.
+
+Usage: python -m benchmarks.serve --port 8765 --gemini-latency 0.5 --gemini-failure-rate 0.02
+"""
+import argparse
+import importlib.util
+import os
+import uvicorn
+from benchmarks import fake_gemini
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fastapi-app.py")
+
+# A few seeded users send most of the traffic, far past the per-user admission
+# defaults; without these the run would mostly measure 429s. Set the variables
+# in the environment to benchmark with other limits.
+BENCHMARK_ADMISSION = {
+    "ADMISSION_USER_RATE": "100000",
+    "ADMISSION_USER_BURST": "10000",
+    "ADMISSION_GLOBAL_RATE": "1000000",
+    "ADMISSION_GLOBAL_BURST": "100000",
+}
+
+
+def load_app():
+    """Import fastapi-app.py (its name is not a valid module name) and return the ASGI app."""
+    spec = importlib.util.spec_from_file_location("feeltrack_app", APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API against a fake Gemini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="mean fake Gemini latency (s)")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2, help="latency standard deviation (s)")
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0, help="fraction of calls that fail")
+    args = parser.parse_args()
+
+    # Read by the app at import time
+    for name, value in BENCHMARK_ADMISSION.items():
+        os.environ.setdefault(name, value)
+    # Must happen before the app starts warming up, which imports and configures the SDK
+    fake_gemini.install(args.gemini_latency, args.gemini_jitter, args.gemini_failure_rate)
+    uvicorn.run(load_app(), host=args.host, port=args.port, log_level="warning")
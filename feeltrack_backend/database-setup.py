@@ -1,6 +1,7 @@
 import mysql.connector
 import os
 from dotenv import load_dotenv
+from migrations import run_migrations
 
 # Load environment variables
 load_dotenv()
@@ -8,6 +9,7 @@ load_dotenv()
 # Database connection configuration
 config = {
     "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
     "user": os.getenv("DB_USER", "root"),
     "password": os.getenv("DB_PASSWORD", "1996"),
 }
@@ -90,6 +92,9 @@ def setup_database():
     print("Database and tables created successfully!")
     
     conn.commit()
+
+    # Bring the schema up to date (indexes, later columns and tables)
+    run_migrations(conn)
     cursor.close()
     conn.close()
 
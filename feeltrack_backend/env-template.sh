@@ -7,3 +7,93 @@ DB_NAME = mentalhealthdb
 
 # Gemini API Key
 GEMINI_API_KEY=
+
+# Database connection pool
+DB_POOL_SIZE=5
+DB_POOL_TIMEOUT=10
+
+# Chat context sent to Gemini
+CONTEXT_RECENT_MESSAGES=20
+CONTEXT_TOKEN_BUDGET=6000
+CONTEXT_SUMMARY_BATCH=10
+
+# Password hashing
+BCRYPT_ROUNDS=12
+PASSWORD_HASH_WORKERS=2
+PASSWORD_HASH_MAX_WAITING=50
+
+# Per-worker in-memory cache for reframes
+LLM_CACHE_SIZE=1024
+LLM_CACHE_TTL=3600
+
+# Gemini client limits (match these to the API quota)
+GEMINI_REQUESTS_PER_MINUTE=60
+GEMINI_BURST=10
+GEMINI_MAX_CONCURRENCY=8
+GEMINI_MAX_RETRIES=3
+GEMINI_BREAKER_THRESHOLD=5
+GEMINI_BREAKER_RESET=30
+
+# Write per-request spans as OTLP/JSON lines to this file (empty disables export)
+TRACE_EXPORT_PATH=
+
+# Seconds between batched writes of Conversations.updated_at / Users.last_login
+WRITE_BEHIND_INTERVAL=2
+
+# Ownership / preferences cache (CACHE_INVALIDATION_POLL > 0 enables cross-worker invalidation)
+ENTITY_CACHE_SIZE=10000
+ENTITY_CACHE_TTL=300
+CACHE_INVALIDATION_POLL=0
+
+# Supportive message push stream (SUPPORTIVE_STREAM_CATCHUP=0 disables the database re-check)
+SUPPORTIVE_STREAM_HEARTBEAT=15
+SUPPORTIVE_STREAM_QUEUE_SIZE=20
+SUPPORTIVE_STREAM_CATCHUP=300
+
+# Largest list of IDs accepted by PUT /users/{user_id}/supportive-messages/read
+BULK_READ_MAX_IDS=500
+# Rows read per database round trip by the data export
+EXPORT_BATCH_SIZE=1000
+
+# Story image generation (requires: pip install diffusers torch)
+IMAGE_MODEL=stabilityai/sd-turbo
+IMAGE_OUTPUT_DIR=generated_images
+IMAGE_WORKERS=1
+IMAGE_MAX_QUEUED=20
+
+# Archive messages of conversations idle this many days (0 disables the archiver)
+ARCHIVE_AFTER_DAYS=90
+ARCHIVE_BATCH_SIZE=500
+ARCHIVE_BATCH_PAUSE=0.5
+ARCHIVE_INTERVAL=3600
+
+# Per-user message search index
+SEARCH_INDEX_DIR=search_index
+SEARCH_LOADED_USERS=256
+SEARCH_PRUNE_INTERVAL=3600
+EMBEDDING_MODEL=models/text-embedding-004
+EMBEDDING_DIM=768
+# Embedding calls have their own rate limit and circuit breaker, apart from chat
+EMBEDDING_REQUESTS_PER_MINUTE=600
+EMBEDDING_BURST=20
+EMBEDDING_MAX_CONCURRENCY=4
+EMBEDDING_MAX_CHARS=8000
+
+# Worker processes for `python fastapi-app.py` (above 1 preloads and forks; install gunicorn)
+WEB_CONCURRENCY=1
+# Seconds the readiness probe waits for the database
+READINESS_TIMEOUT=2
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE=1000
+
+# Admission control for chat turns (rates per minute; ADMISSION_SHARED_PATH shares limits between workers)
+ADMISSION_USER_RATE=20
+ADMISSION_USER_BURST=5
+ADMISSION_GLOBAL_RATE=600
+ADMISSION_GLOBAL_BURST=50
+ADMISSION_MAX_IN_FLIGHT=32
+ADMISSION_MAX_QUEUED=64
+ADMISSION_MAX_WAIT=5
+ADMISSION_BACKGROUND_SHARE=0.25
+ADMISSION_SHARED_PATH=
@@ -1,40 +1,317 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import mysql.connector
 import mysql.connector.pooling
 import os
 import time
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import base64
 import hashlib
+import importlib.util
+import json
+import socket
+import sys
 import uuid
-import google.generativeai as genai
+import zipfile
+from contextlib import asynccontextmanager
+from passwords import make_password_context
+from response_cache import LRUCache, ResponseCache, make_cache_key
+from gemini_client import GeminiClient
+from image_jobs import ImageJobQueue, QueueFullError
+from admission import Lane, MemoryBucketStore, PriorityLimiter, RateLimiter, Rejected, SQLiteBucketStore
+from search_index import SearchIndex
+import tracing
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
+# Gemini API (the SDK is imported on first use or during warm-up, not here)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
 MODEL_NAME = "models/gemini-1.5-pro"
+
+
+def record_llm_call(operation, seconds, prompt, response, error):
+    """Record a Gemini call as a span with estimated token counts."""
+    prompt_tokens = estimate_tokens(prompt)
+    # Embedding calls return a vector, not text
+    response_tokens = estimate_tokens(response) if isinstance(response, str) else 0
+    attributes = {"llm.prompt_tokens": prompt_tokens, "llm.response_tokens": response_tokens}
+    if error is not None:
+        attributes["error"] = type(error).__name__
+    tracing.record_span(f"gemini.{operation}", "llm", seconds, attributes)
+    tracing.registry.inc(tracing.llm_calls, operation=operation, outcome="error" if error else "ok")
+    tracing.registry.inc(tracing.llm_tokens, prompt_tokens, operation=operation, direction="prompt")
+    tracing.registry.inc(tracing.llm_tokens, response_tokens, operation=operation, direction="response")
+
+
+# One shared client for every Gemini call, tuned to the API quota
+gemini = GeminiClient(
+    MODEL_NAME,
+    api_key=GEMINI_API_KEY,
+    requests_per_minute=float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60")),
+    burst=int(os.getenv("GEMINI_BURST", "10")),
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+    observer=record_llm_call,
+)
+# Set TRACE_EXPORT_PATH to write every request's spans to a file as OTLP/JSON
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+trace_exporter = tracing.FileSpanExporter(TRACE_EXPORT_PATH, "feeltrack-api") if TRACE_EXPORT_PATH else None
+# Worker processes for `python fastapi-app.py`; above 1 the app is preloaded and forked
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+# Per-call time limits for the chat pipeline (seconds)
+AI_RESPONSE_TIMEOUT = float(os.getenv("AI_RESPONSE_TIMEOUT", "20"))
+REFRAME_TIMEOUT = float(os.getenv("REFRAME_TIMEOUT", "30"))
+# Per-worker cache for reframes, shared by identical normalised messages. It holds
+# users' own words, so it stays in process memory and is never written to disk.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+llm_cache = ResponseCache(max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+# Read-through cache for conversation/message ownership and user preferences
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "10000"))
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "300"))
+# Seconds between polls of the cross-worker invalidation log (0 disables it;
+# other workers then see preference changes once their TTL expires)
+CACHE_INVALIDATION_POLL = float(os.getenv("CACHE_INVALIDATION_POLL", "0"))
+# Largest list of IDs accepted by the bulk mark-as-read endpoint
+BULK_READ_MAX_IDS = int(os.getenv("BULK_READ_MAX_IDS", "500"))
+# Rows read per database round trip by the data export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Push stream for supportive messages
+SUPPORTIVE_STREAM_HEARTBEAT = float(os.getenv("SUPPORTIVE_STREAM_HEARTBEAT", "15"))
+SUPPORTIVE_STREAM_QUEUE_SIZE = int(os.getenv("SUPPORTIVE_STREAM_QUEUE_SIZE", "20"))
+# With several workers a message may be generated on a worker the client is not
+# connected to; open streams re-check the database this often to catch those (0 disables)
+SUPPORTIVE_STREAM_CATCHUP = float(os.getenv("SUPPORTIVE_STREAM_CATCHUP", "300"))
+# How often buffered Conversations.updated_at / Users.last_login bumps are written (seconds)
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "2"))
+# Messages of conversations idle for this many days move to MessagesArchive (0 disables)
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "0.5"))  # seconds between batches
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))  # seconds between runs
+# Admission control for the LLM-backed chat endpoints. Rates are per minute; a
+# request over its user's or the global budget gets a 429 with Retry-After.
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "20"))
+ADMISSION_USER_BURST = int(os.getenv("ADMISSION_USER_BURST", "5"))
+ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "600"))
+ADMISSION_GLOBAL_BURST = int(os.getenv("ADMISSION_GLOBAL_BURST", "50"))
+# Chat turns running at once per worker, and how many may wait for a slot
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "64"))
+# Longest a chat turn may wait for a slot before it is shed (seconds)
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "5"))
+# Share of the slots that background supportive message generation may use
+ADMISSION_BACKGROUND_SHARE = float(os.getenv("ADMISSION_BACKGROUND_SHARE", "0.25"))
+# Set ADMISSION_SHARED_PATH to a local file to share rate limits between workers on one host
+ADMISSION_SHARED_PATH = os.getenv("ADMISSION_SHARED_PATH")
+# Password hashing: bcrypt for new hashes, legacy unsalted SHA-256 hashes are
+# still accepted and upgraded to bcrypt on the next successful login
+pwd_context = make_password_context(int(os.getenv("BCRYPT_ROUNDS", "12")))
+# bcrypt is deliberately slow, so it runs on its own small pool and a login storm
+# can only occupy these threads, never the event loop or the database executor
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "50"))
+# Conversation context sent to Gemini: rolling summary plus the most recent turns
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Older messages are folded into the summary once this many have left the recent window
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "10"))
+# Supportive message scheduler
+SCHEDULER_INTERVAL = float(os.getenv("SCHEDULER_INTERVAL", "60"))  # seconds between runs
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))  # users claimed per run
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "5"))  # parallel Gemini calls
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+SCHEDULER_RETRY_DELAY = int(os.getenv("SCHEDULER_RETRY_DELAY", "600"))  # seconds before a failed user is retried
+# Optional static sharding of users across scheduler workers (user_id % count == index)
+SCHEDULER_SHARD_COUNT = int(os.getenv("SCHEDULER_SHARD_COUNT", "1"))
+SCHEDULER_SHARD_INDEX = int(os.getenv("SCHEDULER_SHARD_INDEX", "0"))
+# Per-user message search (keyword index plus Gemini embeddings)
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", "search_index")
+SEARCH_LOADED_USERS = int(os.getenv("SEARCH_LOADED_USERS", "256"))  # indexes kept in memory
+# Seconds between sweeps that delete the indexes of removed users (0 disables them)
+SEARCH_PRUNE_INTERVAL = float(os.getenv("SEARCH_PRUNE_INTERVAL", "3600"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "768"))
+# Embeddings have their own quota and breaker, apart from chat
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "600"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+# Longer texts are cut to this many characters, inside the embedding model's input limit
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "8000"))
+# Story image generation (needs the optional diffusers and torch packages)
+IMAGE_MODEL = os.getenv("IMAGE_MODEL", "stabilityai/sd-turbo")
+IMAGE_OUTPUT_DIR = os.getenv("IMAGE_OUTPUT_DIR", "generated_images")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))  # one per GPU is usually right
+IMAGE_MAX_QUEUED = int(os.getenv("IMAGE_MAX_QUEUED", "20"))
+IMAGE_GENERATION_AVAILABLE = importlib.util.find_spec("diffusers") is not None
 # Configure database connection pool
 db_config = {
     "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
     "user": os.getenv("DB_USER", "root"),
     "password": os.getenv("DB_PASSWORD", "1996"),
     "database": os.getenv("DB_NAME", "mentalhealthdb"),
 }
 
-pool = mysql.connector.pooling.MySQLConnectionPool(
-    pool_name="mypool",
-    pool_size=5,
-    **db_config
-)
+# mysql.connector caps a single pool at CNX_POOL_MAXSIZE (32) connections
+DB_POOL_SIZE = min(int(os.getenv("DB_POOL_SIZE", "5")), mysql.connector.pooling.CNX_POOL_MAXSIZE)
+# How long a request may wait for a free connection before giving up (seconds)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+# orjson and brotli-asgi are optional speedups; without them the standard encoder and gzip are used
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli_asgi") is not None
+
+
+# Per-request accumulator for time spent waiting on database capacity (seconds)
+db_wait = contextvars.ContextVar("db_wait", default=None)
+
+
+def record_db_wait(seconds: float):
+    """Add to the current request's database wait, if a request is being tracked."""
+    accumulator = db_wait.get()
+    if accumulator is not None:
+        accumulator[0] += seconds
+
+
+class PooledConnection:
+    """Proxy around a pooled connection that frees its pool slot on close()."""
+
+    def __init__(self, conn, release):
+        self._conn = conn
+        self._release = release
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._release is not None:
+            self._conn.close()
+            self._release()
+            self._release = None
+
+
+class BoundedConnectionPool:
+    """Connection pool that blocks until a connection is free instead of raising.
+
+    mysql.connector's pool raises PoolError as soon as every connection is
+    checked out. Here callers wait up to `timeout` seconds for a slot, and the
+    pool keeps wait-time and utilisation counters for monitoring.
+    """
+
+    def __init__(self, size: int, timeout: float, **config):
+        self.size = size
+        self.timeout = timeout
+        self.config = config
+        # Connections are opened on first use (or by warm_up), so importing the app
+        # never touches the database and a forked worker never inherits sockets
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def get_connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise HTTPException(status_code=503, detail="Database is busy, please try again")
+        waited = time.perf_counter() - start
+        try:
+            conn = self._connection_pool().get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        record_db_wait(waited)
+        return PooledConnection(conn, self._release)
+
+    def _connection_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name="mypool",
+                        pool_size=self.size,
+                        **self.config
+                    )
+        return self._pool
+
+    def warm_up(self):
+        """Open the pool's connections ahead of the first request. Blocks."""
+        self._connection_pool()
+
+    @property
+    def ready(self):
+        return self._pool is not None
+
+    def _release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def stats(self):
+        """Snapshot of pool wait time and utilisation."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "utilisation": self.in_use / self.size,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+pool = BoundedConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, **db_config)
+
+# Blocking database calls run here so they never stall the event loop.
+# Extra threads let queued requests wait on the pool, where the wait is measured.
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE * 2, thread_name_prefix="db")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work when a worker starts and stop it on shutdown.
+
+    Runs in every worker, after the fork in pre-fork mode, so nothing that owns
+    threads, sockets or tasks is created before it.
+    """
+    await start_background_work()
+    try:
+        yield
+    finally:
+        await stop_background_work()
+
 
 # FastAPI app
-app = FastAPI(title="Mental Health Support App API")
+app = FastAPI(title="Mental Health Support App API", lifespan=lifespan)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -42,8 +319,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor", "Server-Timing", "X-Trace-Id", "ETag"],  # Pagination cursors, timings
 )
 
+
+class SelectiveCompression:
+    """Compress responses, except Server-Sent Event streams and binary downloads.
+
+    Streams must reach the client chunk by chunk, which a compressor's
+    buffering would hold back, and images and zip archives are already compressed.
+    """
+
+    UNCOMPRESSED_SUFFIXES = ("/stream", "/image", "/export.zip")
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        if BROTLI_AVAILABLE:
+            from brotli_asgi import BrotliMiddleware
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].endswith(self.UNCOMPRESSED_SUFFIXES):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(SelectiveCompression, minimum_size=COMPRESSION_MIN_SIZE)
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Trace each request, record latency metrics and report timings in Server-Timing."""
+    wait = [0.0]
+    db_wait.set(wait)
+    trace = tracing.Trace(f"{request.method} {request.url.path}")
+    tracing.current_trace.set(trace)
+    start = time.perf_counter()
+
+    response = await call_next(request)
+
+    duration = time.perf_counter() - start
+    endpoint = getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+    tracing.registry.observe(tracing.request_duration, duration, endpoint=endpoint)
+    tracing.registry.inc(tracing.requests_total, endpoint=endpoint, method=request.method,
+                         status=response.status_code)
+    response.headers["Server-Timing"] = f"db-wait;dur={wait[0] * 1000:.2f}, total;dur={duration * 1000:.2f}"
+    response.headers["X-Trace-Id"] = trace.trace_id
+
+    if trace_exporter is not None:
+        trace.end_ns = time.time_ns()
+        trace.attributes = {"http.method": request.method, "http.route": endpoint,
+                            "http.status_code": response.status_code}
+        trace_exporter.export(trace)
+    return response
+
 # Pydantic models
 class UserCreate(BaseModel):
     username: str
@@ -90,6 +422,21 @@ class SupportiveMessageResponse(BaseModel):
     is_read: bool
 
 
+class CheckInCreate(BaseModel):
+    emotion: str
+    notes: Optional[str] = None
+
+
+class GenerationRequest(BaseModel):
+    theme: str
+    story_id: int
+
+
+class SupportiveMessagesRead(BaseModel):
+    message_ids: Optional[List[int]] = None
+    up_to_message_id: Optional[int] = None
+
+
 class UserPreferencesUpdate(BaseModel):
     notification_frequency: Optional[int] = None
     active_hours_start: Optional[str] = None
@@ -99,23 +446,218 @@ class UserPreferencesUpdate(BaseModel):
 
 
 # Helper functions
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    """Encode a (timestamp, id) keyset position as an opaque cursor."""
+    raw = f"{ts.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor produced by encode_cursor back into (timestamp, id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ts, row_id = raw.split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def rows_etag(rows, *fields) -> str:
+    """Weak ETag over the fields of a list of rows that change when the list does."""
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update(repr(tuple(row[field] for field in fields)).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check an ETag against the request's If-None-Match header (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in header.split(","))
+
+
+def rows_response(request: Request, rows, etag: str = None, bool_fields=(), headers=None):
+    """Send trusted database rows as JSON without re-validating them.
+
+    The rows already have exactly the columns of the endpoint's response model,
+    so the model is only used for the API docs. Returns 304 when the client
+    already holds the same version. MySQL returns BOOLEAN columns as 0/1, so
+    `bool_fields` are converted to match the documented types.
+    """
+    headers = dict(headers or {})
+    if etag is not None:
+        headers["ETag"] = etag
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+    for row in rows:
+        for field in bool_fields:
+            row[field] = bool(row[field])
+    if ORJSON_AVAILABLE:
+        return ORJSONResponse(rows, headers=headers)
+    return JSONResponse(jsonable_encoder(rows), headers=headers)
+
+
 def get_db_connection():
     """Get a connection from the pool."""
     return pool.get_connection()
 
 
-def hash_password(password: str) -> str:
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database helper on the database executor."""
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def call():
+        # Time spent queued for an executor thread counts as database wait too
+        record_db_wait(time.perf_counter() - submitted)
+        with tracing.span(func.__name__, "db") as attributes:
+            result = func(*args, **kwargs)
+            rows = tracing.count_rows(result)
+            attributes["db.rows"] = rows
+        tracing.registry.inc(tracing.db_rows, rows, helper=func.__name__)
+        return result
+
+    # Copy the context so the helper sees the calling request's context variables
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, ctx.run, call)
+
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="kdf")
+password_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_WAITING)
+
+
+async def run_kdf(func, *args):
+    """Run a password hashing call on the KDF pool, shedding load when it is saturated."""
+    if password_slots.locked():
+        raise HTTPException(status_code=503, detail="Too many login attempts, please try again")
+    async with password_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, functools.partial(func, *args))
+
+
+async def hash_password(password: str) -> str:
     """Hash a password for storing."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    return await run_kdf(pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str):
+    """Check a password against its stored hash.
+
+    Returns (is_valid, new_hash) where new_hash is set when the stored hash uses
+    a deprecated scheme and should be replaced.
+    """
+    return await run_kdf(pwd_context.verify_and_update, password, password_hash)
 
 
 # Database operations functions
-def create_user(username: str, email: str, password: str):
+class WriteBehindTimestamps:
+    """Coalesces timestamp bumps in memory and writes them in batched UPDATEs.
+
+    Hot single-row updates such as Conversations.updated_at on every message
+    are collected per key until the next flush. The column is set to the
+    database's NOW() when the flush is written, never to the time of the
+    bump, so a value only becomes visible once it is newer than any sync
+    cursor already handed out for the column.
+    """
+
+    def __init__(self, table: str, key_column: str, column: str, batch_size: int = 500):
+        self.table = table
+        self.key_column = key_column
+        self.column = column
+        self.batch_size = batch_size
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def touch(self, key: int):
+        with self._lock:
+            self._pending.add(key)
+
+    def flush(self):
+        """Write every pending bump; runs on the database executor."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        keys = sorted(pending)
+        for i in range(0, len(keys), self.batch_size):
+            try:
+                self._write(keys[i:i + self.batch_size])
+            except Exception:
+                # Put unwritten bumps back for the next flush
+                with self._lock:
+                    self._pending.update(keys[i:])
+                raise
+        return len(keys)
+
+    def _write(self, keys):
+        placeholders = ", ".join(["%s"] * len(keys))
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"UPDATE {self.table} SET {self.column} = NOW() WHERE {self.key_column} IN ({placeholders})",
+                keys
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+
+conversation_activity = WriteBehindTimestamps("Conversations", "conversation_id", "updated_at")
+last_login_buffer = WriteBehindTimestamps("Users", "user_id", "last_login")
+
+
+async def flush_write_behind():
+    """Flush every write-behind buffer."""
+    for buffer in (conversation_activity, last_login_buffer):
+        try:
+            await run_db(buffer.flush)
+        except Exception as e:
+            print(f"Error flushing {buffer.table}.{buffer.column}: {e}")
+
+
+async def run_write_behind():
+    """Periodic loop that flushes buffered timestamp bumps until cancelled."""
+    while True:
+        await asyncio.sleep(WRITE_BEHIND_INTERVAL)
+        await flush_write_behind()
+
+
+class UnitOfWork:
+    """One pooled connection and one transaction for a group of statements.
+
+    Commits when the block exits normally and rolls back if it raises.
+    """
+
+    def __enter__(self):
+        self.conn = get_db_connection()
+        self.cursor = self.conn.cursor(dictionary=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.cursor.close()
+            self.conn.close()
+
+    def execute(self, query: str, params=()):
+        self.cursor.execute(query, params)
+        return self.cursor
+
+
+def create_user(username: str, email: str, hashed_password: str):
     """Create a new user in the database."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        hashed_password = hash_password(password)
         cursor.execute(
             "INSERT INTO Users (username, email, password_hash) VALUES (%s, %s, %s)",
             (username, email, hashed_password)
@@ -144,8 +686,8 @@ def create_user(username: str, email: str, password: str):
         conn.close()
 
 
-def authenticate_user(username: str, password: str):
-    """Authenticate a user by username and password."""
+def get_user_credentials(username: str):
+    """Get a user's ID, profile and password hash by username."""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
@@ -153,27 +695,43 @@ def authenticate_user(username: str, password: str):
             "SELECT user_id, username, email, password_hash FROM Users WHERE username = %s",
             (username,)
         )
-        user = cursor.fetchone()
-        if not user:
-            return None
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
 
-        hashed_password = hash_password(password)
-        if hashed_password != user["password_hash"]:
-            return None
 
-        # Update last login timestamp
+def upgrade_password_hash(user_id: int, new_password_hash: str):
+    """Replace a password hash that used a deprecated scheme."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
         cursor.execute(
-            "UPDATE Users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s",
-            (user["user_id"],)
+            "UPDATE Users SET password_hash = %s WHERE user_id = %s",
+            (new_password_hash, user_id)
         )
         conn.commit()
-
-        return {"user_id": user["user_id"], "username": user["username"], "email": user["email"]}
     finally:
         cursor.close()
         conn.close()
 
 
+async def authenticate_user(username: str, password: str):
+    """Authenticate a user by username and password."""
+    user = await run_db(get_user_credentials, username)
+    if not user:
+        return None
+
+    is_valid, new_hash = await verify_password(password, user["password_hash"])
+    if not is_valid:
+        return None
+
+    if new_hash:
+        await run_db(upgrade_password_hash, user["user_id"], new_hash)
+    last_login_buffer.touch(user["user_id"])
+    return {"user_id": user["user_id"], "username": user["username"], "email": user["email"]}
+
+
 def get_user(user_id: int):
     """Get a user by ID."""
     conn = get_db_connection()
@@ -207,6 +765,42 @@ def get_conversations(user_id: int):
         conn.close()
 
 
+def get_conversations_page(user_id: int, limit: int, before: str = None, since: str = None):
+    """Get one keyset page of a user's conversations, most recently updated first.
+
+    `before` continues from a previous page. `since` returns only conversations
+    updated after that cursor, oldest change first so a sync can resume from
+    the last row it received.
+    """
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if before:
+        ts, row_id = decode_cursor(before)
+        conditions.append("(updated_at < %s OR (updated_at = %s AND conversation_id < %s))")
+        params += [ts, ts, row_id]
+    if since:
+        ts, row_id = decode_cursor(since)
+        conditions.append("(updated_at > %s OR (updated_at = %s AND conversation_id > %s))")
+        params += [ts, ts, row_id]
+        order = "ASC"
+    else:
+        order = "DESC"
+    params.append(limit)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            f"SELECT conversation_id, title, created_at, updated_at FROM Conversations WHERE {' AND '.join(conditions)} "
+            f"ORDER BY updated_at {order}, conversation_id {order} LIMIT %s",
+            params
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def create_conversation(user_id: int, title: str = "New Conversation"):
     """Create a new conversation."""
     conn = get_db_connection()
@@ -223,53 +817,366 @@ def create_conversation(user_id: int, title: str = "New Conversation"):
         conn.close()
 
 
-def get_messages(conversation_id: int):
-    """Get all messages in a conversation."""
+def get_conversation(conversation_id: int):
+    """Get a single conversation by ID."""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
         cursor.execute(
-            "SELECT message_id, content, is_user, positive_reframe, timestamp FROM Messages WHERE conversation_id = %s ORDER BY timestamp",
+            "SELECT conversation_id, title, created_at, updated_at FROM Conversations WHERE conversation_id = %s",
             (conversation_id,)
         )
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def with_archive(select: str, params, order_by: str, limit: Optional[int] = None):
+    """Run a Messages query over both the hot table and MessagesArchive.
+
+    Returns the SQL and parameters for a UNION ALL of `select` (which must read
+    FROM Messages) and the same query against the archive. Each branch is
+    ordered and limited on its own so it can use its conversation index.
+    """
+    tail = f" ORDER BY {order_by}" + (" LIMIT %s" if limit is not None else "")
+    branch_params = list(params) + ([limit] if limit is not None else [])
+    archive = select.replace("FROM Messages", "FROM MessagesArchive")
+    outer_params = [limit] if limit is not None else []
+    return f"({select}{tail}) UNION ALL ({archive}{tail}){tail}", branch_params * 2 + outer_params
+
+
+def get_messages(conversation_id: int):
+    """Get all messages in a conversation."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(*with_archive(
+            "SELECT message_id, content, is_user, positive_reframe, timestamp FROM Messages WHERE conversation_id = %s",
+            (conversation_id,), "timestamp, message_id"
+        ))
         return cursor.fetchall()
     finally:
         cursor.close()
         conn.close()
 
 
-def create_message(conversation_id: int, content: str, is_user: bool, positive_reframe: str = None):
-    """Create a new message."""
+def get_messages_page(conversation_id: int, limit: int, before: str = None, since: str = None):
+    """Get one keyset page of messages, oldest first.
+
+    Without `since` this is the newest `limit` messages (older than `before`
+    when given). With `since` it is the next `limit` messages after that cursor,
+    which clients use to fetch only what they have not seen yet.
+    """
+    conditions = ["conversation_id = %s"]
+    params = [conversation_id]
+    if before:
+        ts, row_id = decode_cursor(before)
+        conditions.append("(timestamp < %s OR (timestamp = %s AND message_id < %s))")
+        params += [ts, ts, row_id]
+    if since:
+        ts, row_id = decode_cursor(since)
+        conditions.append("(timestamp > %s OR (timestamp = %s AND message_id > %s))")
+        params += [ts, ts, row_id]
+        order = "ASC"
+    else:
+        order = "DESC"
+
     conn = get_db_connection()
-    cursor = conn.cursor()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(*with_archive(
+            f"SELECT message_id, content, is_user, positive_reframe, timestamp FROM Messages WHERE {' AND '.join(conditions)}",
+            params, f"timestamp {order}, message_id {order}", limit
+        ))
+        rows = cursor.fetchall()
+        return rows if since else list(reversed(rows))
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_messages_after(conversation_id: int, after_message_id: int, limit: int):
+    """Get up to `limit` messages that come after a given message, oldest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(*with_archive(
+            "SELECT message_id, content, is_user FROM Messages WHERE conversation_id = %s AND message_id > %s",
+            (conversation_id, after_message_id), "message_id", limit
+        ))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_conversation_summary(conversation_id: int):
+    """Get the rolling summary of a conversation, if one has been written."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
     try:
-        # Update the conversation's updated_at timestamp
         cursor.execute(
-            "UPDATE Conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = %s",
+            "SELECT summary, summarized_through FROM ConversationSummaries WHERE conversation_id = %s",
             (conversation_id,)
         )
-        conn.commit()
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def save_conversation_summary(conversation_id: int, summary: str, summarized_through: int):
+    """Store the rolling summary and the last message it covers."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
         cursor.execute(
-            "INSERT INTO Messages (conversation_id, content, is_user, positive_reframe) VALUES (%s, %s, %s, %s)",
-            (conversation_id, content, is_user, positive_reframe)
+            """
+            INSERT INTO ConversationSummaries (conversation_id, summary, summarized_through)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE summary = VALUES(summary), summarized_through = VALUES(summarized_through)
+            """,
+            (conversation_id, summary, summarized_through)
         )
         conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
 
 
+def begin_chat_turn(user_id: int, conversation_id: Optional[int], content: str,
+                    recent_limit: int):
+    """Store a user message and load the context for replying, in one transaction.
+
+    Creates the conversation when none is given. For an existing conversation
+    the ownership check is folded into the INSERT, which writes nothing unless
+    the conversation belongs to the user. Returns the conversation id, the new
+    message id, the rolling summary and the recent messages before this one.
+    The conversation's updated_at bump is left to the write-behind buffer.
+    """
+    with UnitOfWork() as uow:
+        if not conversation_id:
+            conversation_id = uow.execute(
+                "INSERT INTO Conversations (user_id) VALUES (%s)",
+                (user_id,)
+            ).lastrowid
 
-        return cursor.lastrowid
+        cursor = uow.execute(
+            """
+            INSERT INTO Messages (conversation_id, content, is_user)
+            SELECT conversation_id, %s, TRUE FROM Conversations
+            WHERE conversation_id = %s AND user_id = %s
+            """,
+            (content, conversation_id, user_id)
+        )
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
+        user_message_id = cursor.lastrowid
+
+        # One read for the context and the new row: its timestamp is stamped by the
+        # database like every other row, so cursors compare one clock, and the summary
+        # is joined onto that row only. Reopening an old conversation pulls its context
+        # back from the archive.
+        rows = uow.execute(*with_archive(
+            """
+            SELECT m.message_id, m.content, m.is_user, m.positive_reframe, m.timestamp, s.summary
+            FROM Messages m
+            LEFT JOIN ConversationSummaries s ON s.conversation_id = m.conversation_id AND m.message_id = %s
+            WHERE m.conversation_id = %s AND m.message_id <= %s
+            """,
+            (user_message_id, conversation_id, user_message_id), "timestamp DESC, message_id DESC", recent_limit + 1
+        )).fetchall()
+
+    recent = []
+    for row in rows:
+        summary = row.pop("summary")
+        if row["message_id"] == user_message_id:
+            timestamp = row["timestamp"]
+            summary_text = summary
+        else:
+            recent.append(row)
+
+    conversation_activity.touch(conversation_id)
+    return {
+        "conversation_id": conversation_id,
+        "user_message_id": user_message_id,
+        "timestamp": timestamp,
+        "summary": summary_text,
+        "recent": list(reversed(recent[:recent_limit])),
+    }
+
+
+def finish_chat_turn(conversation_id: int, content: str):
+    """Store the AI reply and return the stored row."""
+    with UnitOfWork() as uow:
+        message_id = uow.execute(
+            "INSERT INTO Messages (conversation_id, content, is_user) VALUES (%s, %s, FALSE)",
+            (conversation_id, content)
+        ).lastrowid
+        # Read back rather than stamped by the app: the two clocks can disagree, and
+        # cursors order this row against the user message the database stamped
+        timestamp = uow.execute(
+            "SELECT timestamp FROM Messages WHERE message_id = %s",
+            (message_id,)
+        ).fetchone()["timestamp"]
+    conversation_activity.touch(conversation_id)
+    return {"message_id": message_id, "content": content, "is_user": False,
+            "positive_reframe": None, "timestamp": timestamp}
+
+
+def set_message_reframe(message_id: int, positive_reframe: str):
+    """Attach a positive reframe to an already stored message."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE Messages SET positive_reframe = %s WHERE message_id = %s",
+            (positive_reframe, message_id)
+        )
+        conn.commit()
     finally:
         cursor.close()
         conn.close()
 
 
+# Message archive
+archived_messages = tracing.registry.counter(
+    "feeltrack_messages_archived_total", "Messages moved from Messages to MessagesArchive")
+
+
+def archive_inactive_messages(cutoff: datetime, batch_size: int):
+    """Move one batch of messages from conversations idle since `cutoff` to the archive.
+
+    Messages newer than the cutoff are left alone as well: updated_at is
+    written behind, so a conversation can look idle just after a new message
+    whose reframe is still to be attached in Messages. Each batch is a short
+    transaction that copies and deletes the same locked rows, so readers
+    always find a message in exactly one of the two tables. Rows locked by
+    another archiver are skipped. Returns the number moved.
+    """
+    with UnitOfWork() as uow:
+        rows = uow.execute(
+            """
+            SELECT m.message_id FROM Conversations c
+            JOIN Messages m ON m.conversation_id = c.conversation_id
+            WHERE c.updated_at < %s AND m.timestamp < %s
+            LIMIT %s
+            FOR UPDATE OF m SKIP LOCKED
+            """,
+            (cutoff, cutoff, batch_size)
+        ).fetchall()
+        message_ids = [row["message_id"] for row in rows]
+        if not message_ids:
+            return 0
+
+        placeholders = ", ".join(["%s"] * len(message_ids))
+        uow.execute(
+            f"""
+            INSERT INTO MessagesArchive (message_id, conversation_id, is_user, content, positive_reframe, timestamp)
+            SELECT message_id, conversation_id, is_user, content, positive_reframe, timestamp
+            FROM Messages WHERE message_id IN ({placeholders})
+            """,
+            message_ids
+        )
+        uow.execute(f"DELETE FROM Messages WHERE message_id IN ({placeholders})", message_ids)
+    tracing.registry.inc(archived_messages, len(message_ids))
+    return len(message_ids)
+
+
+async def run_message_archiver():
+    """Periodic loop that archives messages of inactive conversations until cancelled."""
+    while True:
+        try:
+            cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+            while await run_db(archive_inactive_messages, cutoff, ARCHIVE_BATCH_SIZE) >= ARCHIVE_BATCH_SIZE:
+                # Space batches out so archiving never crowds out live traffic
+                await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+        except Exception as e:
+            print(f"Message archiver error: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+# Check-ins
+# Mood score (1 = very low, 5 = very good) for each emotion offered by the check-in page
+EMOTION_SCORES = {
+    "Happy": 5,
+    "Calm": 4,
+    "Neutral": 3,
+    "Confused": 3,
+    "Tired": 2,
+    "Anxious": 2,
+    "Sad": 1,
+    "Angry": 1,
+}
+
+
+def week_start(day):
+    """Get the Monday of the week containing a date."""
+    return day - timedelta(days=day.weekday())
+
+
+def create_check_in(user_id: int, emotion: str, notes: Optional[str]):
+    """Store a check-in and fold it into the user's daily and weekly rollups.
+
+    The rollups are updated in the same transaction as the insert, so the
+    weekly wrap only ever reads the rollup rows, never the raw check-ins.
+    """
+    mood_score = EMOTION_SCORES[emotion]
+    with UnitOfWork() as uow:
+        check_in_id = uow.execute(
+            "INSERT INTO CheckIns (user_id, emotion, mood_score, notes) VALUES (%s, %s, %s, %s)",
+            (user_id, emotion, mood_score, notes)
+        ).lastrowid
+        created_at = uow.execute(
+            "SELECT created_at FROM CheckIns WHERE check_in_id = %s",
+            (check_in_id,)
+        ).fetchone()["created_at"]
+        day = created_at.date()
+        uow.execute(
+            """
+            INSERT INTO CheckInDailyRollups (user_id, day, check_ins, mood_total) VALUES (%s, %s, 1, %s)
+            ON DUPLICATE KEY UPDATE check_ins = check_ins + 1, mood_total = mood_total + VALUES(mood_total)
+            """,
+            (user_id, day, mood_score)
+        )
+        uow.execute(
+            """
+            INSERT INTO CheckInWeeklyEmotions (user_id, week_start, emotion, check_ins) VALUES (%s, %s, %s, 1)
+            ON DUPLICATE KEY UPDATE check_ins = check_ins + 1
+            """,
+            (user_id, week_start(day), emotion)
+        )
+    return {"check_in_id": check_in_id, "emotion": emotion, "mood_score": mood_score,
+            "notes": notes, "created_at": created_at}
+
+
+def get_weekly_rollups(user_id: int, start):
+    """Get the daily rollups and emotion counts for the week starting on `start`."""
+    with UnitOfWork() as uow:
+        days = uow.execute(
+            "SELECT day, check_ins, mood_total FROM CheckInDailyRollups WHERE user_id = %s AND day >= %s AND day < %s ORDER BY day",
+            (user_id, start, start + timedelta(days=7))
+        ).fetchall()
+        emotions = uow.execute(
+            "SELECT emotion, check_ins FROM CheckInWeeklyEmotions WHERE user_id = %s AND week_start = %s ORDER BY check_ins DESC, emotion",
+            (user_id, start)
+        ).fetchall()
+    return days, emotions
+
+
+# User-facing preference columns (the scheduler's lease bookkeeping stays internal)
+PREFERENCE_COLUMNS = ("user_id, notification_frequency, active_hours_start, active_hours_end, "
+                      "notifications_enabled, theme")
+
+
 def get_user_preferences(user_id: int):
     """Get user preferences."""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
         cursor.execute(
-            "SELECT * FROM UserPreferences WHERE user_id = %s",
+            f"SELECT {PREFERENCE_COLUMNS} FROM UserPreferences WHERE user_id = %s",
             (user_id,)
         )
         prefs = cursor.fetchone()
@@ -281,7 +1188,7 @@ def get_user_preferences(user_id: int):
             )
             conn.commit()
             cursor.execute(
-                "SELECT * FROM UserPreferences WHERE user_id = %s",
+                f"SELECT {PREFERENCE_COLUMNS} FROM UserPreferences WHERE user_id = %s",
                 (user_id,)
             )
             prefs = cursor.fetchone()
@@ -317,17 +1224,128 @@ def update_user_preferences(user_id: int, preferences: dict):
         conn.close()
 
 
+# Data export: sections in export order, each with its query over one user's
+# rows, the keyset it is read in (matching the table's user index) and its
+# BOOLEAN columns. Messages are walked one conversation at a time.
+EXPORT_SECTIONS = {
+    "preferences": (f"SELECT {PREFERENCE_COLUMNS} FROM UserPreferences WHERE user_id = %s",
+                    ("user_id",), ("notifications_enabled",)),
+    "conversations": ("SELECT conversation_id, title, created_at, updated_at FROM Conversations WHERE user_id = %s",
+                      ("conversation_id",), ()),
+    "messages": ("SELECT message_id, conversation_id, is_user, content, positive_reframe, timestamp FROM Messages WHERE conversation_id = %s",
+                 ("timestamp", "message_id"), ("is_user",)),
+    "supportive_messages": ("SELECT message_id, content, is_read, created_at, sent_at FROM SupportiveMessages WHERE user_id = %s",
+                            ("message_id",), ("is_read",)),
+    "check_ins": ("SELECT check_in_id, emotion, mood_score, notes, created_at FROM CheckIns WHERE user_id = %s",
+                  ("created_at", "check_in_id"), ()),
+}
+
+
+def keyset_after(keys, values):
+    """SQL condition and parameters selecting rows strictly after `values` in `keys` order."""
+    conditions, params = [], []
+    for i, key in enumerate(keys):
+        conditions.append(" AND ".join([f"{k} = %s" for k in keys[:i]] + [f"{key} > %s"]))
+        params += list(values[:i + 1])
+    return "(" + " OR ".join(f"({condition})" for condition in conditions) + ")", params
+
+
+def read_export_batch(user_id: int, section: str, after, limit: int):
+    """Read the next batch of one export section after the keyset position `after`.
+
+    Returns the rows and the position to continue from, which is None once the
+    section is exhausted. Each call is one short query on a pooled connection,
+    so a slow download never holds a connection between batches.
+    """
+    select, keys, bool_fields = EXPORT_SECTIONS[section]
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        if section == "messages":
+            # Position is [conversation_id, timestamp, message_id]; the conversation is
+            # re-resolved through its owner so a cursor can only reach this user's data
+            conversation_id, *last = after or [0, None, None]
+            cursor.execute(
+                "SELECT MIN(conversation_id) AS conversation_id FROM Conversations WHERE user_id = %s AND conversation_id >= %s",
+                (user_id, conversation_id)
+            )
+            owned = cursor.fetchone()["conversation_id"]
+            if owned is None:
+                return [], None
+            if owned != conversation_id:
+                last = [None, None]
+            params = [owned]
+            if last[0] is not None:
+                condition, condition_params = keyset_after(keys, last)
+                select += f" AND {condition}"
+                params += condition_params
+            cursor.execute(*with_archive(select, params, ", ".join(keys), limit))
+            rows = cursor.fetchall()
+            if len(rows) == limit:
+                next_after = [owned] + [rows[-1][key] for key in keys]
+            else:
+                next_after = [owned + 1, None, None]
+        else:
+            params = [user_id]
+            if after is not None:
+                condition, condition_params = keyset_after(keys, after)
+                select += f" AND {condition}"
+                params += condition_params
+            cursor.execute(f"{select} ORDER BY {', '.join(keys)} LIMIT %s", params + [limit])
+            rows = cursor.fetchall()
+            next_after = [rows[-1][key] for key in keys] if len(rows) == limit else None
+        for row in rows:
+            for field in bool_fields:
+                row[field] = bool(row[field])
+        return rows, next_after
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def create_supportive_message(user_id: int, content: str):
-    """Create a new supportive message."""
+    """Create a new supportive message and return the stored row."""
+    with UnitOfWork() as uow:
+        message_id = uow.execute(
+            "INSERT INTO SupportiveMessages (user_id, content) VALUES (%s, %s)",
+            (user_id, content)
+        ).lastrowid
+        created_at = uow.execute(
+            "SELECT created_at FROM SupportiveMessages WHERE message_id = %s",
+            (message_id,)
+        ).fetchone()["created_at"]
+        uow.execute(
+            "UPDATE Users SET unread_supportive_count = unread_supportive_count + 1 WHERE user_id = %s",
+            (user_id,)
+        )
+    return {"message_id": message_id, "content": content, "created_at": created_at, "is_read": False}
+
+
+def get_unread_supportive_messages_after(user_id: int, after_message_id: int):
+    """Get unread supportive messages newer than a given message, oldest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT message_id, content, created_at, is_read FROM SupportiveMessages WHERE user_id = %s AND is_read = FALSE AND message_id > %s ORDER BY message_id",
+            (user_id, after_message_id)
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_latest_supportive_message_id(user_id: int):
+    """Get the ID of a user's newest supportive message, or 0 if they have none."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute(
-            "INSERT INTO SupportiveMessages (user_id, content) VALUES (%s, %s)",
-            (user_id, content)
+            "SELECT COALESCE(MAX(message_id), 0) FROM SupportiveMessages WHERE user_id = %s",
+            (user_id,)
         )
-        conn.commit()
-        return cursor.lastrowid
+        return cursor.fetchone()[0]
     finally:
         cursor.close()
         conn.close()
@@ -348,16 +1366,46 @@ def get_unread_supportive_messages(user_id: int):
         conn.close()
 
 
-def mark_supportive_message_read(message_id: int):
-    """Mark a supportive message as read."""
+def mark_supportive_messages_read(user_id: int, message_ids: Optional[List[int]] = None,
+                                  up_to_message_id: Optional[int] = None):
+    """Mark a user's unread supportive messages as read and return how many changed.
+
+    Marks either the given message IDs or every message up to and including
+    `up_to_message_id`. Ownership is part of the UPDATE's WHERE clause, so IDs
+    belonging to other users are silently skipped. The user's unread counter is
+    decreased by the number of rows that actually flipped, in the same transaction.
+    """
+    if message_ids is not None:
+        if not message_ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(message_ids))
+        query = f"UPDATE SupportiveMessages SET is_read = TRUE WHERE user_id = %s AND is_read = FALSE AND message_id IN ({placeholders})"
+        params = (user_id, *message_ids)
+    else:
+        query = "UPDATE SupportiveMessages SET is_read = TRUE WHERE user_id = %s AND is_read = FALSE AND message_id <= %s"
+        params = (user_id, up_to_message_id)
+
+    with UnitOfWork() as uow:
+        updated = uow.execute(query, params).rowcount
+        if updated:
+            uow.execute(
+                "UPDATE Users SET unread_supportive_count = GREATEST(unread_supportive_count - %s, 0) WHERE user_id = %s",
+                (updated, user_id)
+            )
+    return updated
+
+
+def get_unread_supportive_count(user_id: int):
+    """Get a user's unread supportive message count from the maintained counter."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute(
-            "UPDATE SupportiveMessages SET is_read = TRUE WHERE message_id = %s",
-            (message_id,)
+            "SELECT unread_supportive_count FROM Users WHERE user_id = %s",
+            (user_id,)
         )
-        conn.commit()
+        row = cursor.fetchone()
+        return row[0] if row else None
     finally:
         cursor.close()
         conn.close()
@@ -380,14 +1428,10 @@ def get_recent_conversation_summary(user_id: int, limit: int = 10):
         conversation_id = result["conversation_id"]
 
         # Get the most recent messages from this conversation
-        cursor.execute(
-            """
-            SELECT content, is_user, positive_reframe FROM Messages 
-            WHERE conversation_id = %s 
-            ORDER BY timestamp DESC LIMIT %s
-            """,
-            (conversation_id, limit)
-        )
+        cursor.execute(*with_archive(
+            "SELECT content, is_user, positive_reframe, timestamp FROM Messages WHERE conversation_id = %s",
+            (conversation_id,), "timestamp DESC", limit
+        ))
         messages = cursor.fetchall()
 
         # Format the messages into a summary
@@ -407,8 +1451,8 @@ def get_recent_conversation_summary(user_id: int, limit: int = 10):
         conn.close()
 
 
-def verify_conversation_owner(conversation_id: int, user_id: int):
-    """Verify that a conversation belongs to a user."""
+def get_conversation_owner(conversation_id: int):
+    """Get the user ID that owns a conversation, or None if it does not exist."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
@@ -417,15 +1461,14 @@ def verify_conversation_owner(conversation_id: int, user_id: int):
             (conversation_id,)
         )
         result = cursor.fetchone()
-        if not result or result[0] != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
+        return result[0] if result else None
     finally:
         cursor.close()
         conn.close()
 
 
-def verify_message_owner(message_id: int, user_id: int):
-    """Verify that a supportive message belongs to a user."""
+def get_supportive_message_owner(message_id: int):
+    """Get the user ID that owns a supportive message, or None if it does not exist."""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
@@ -434,13 +1477,151 @@ def verify_message_owner(message_id: int, user_id: int):
             (message_id,)
         )
         result = cursor.fetchone()
-        if not result or result[0] != user_id:
-            raise HTTPException(status_code=403, detail="Not authorized to access this message")
+        return result[0] if result else None
     finally:
         cursor.close()
         conn.close()
 
 
+class InvalidationChannel:
+    """Cross-worker cache invalidation through a shared log table.
+
+    Writers append (cache, key) rows; every worker polls for rows newer than the
+    last one it saw and drops those keys from its local caches.
+    """
+
+    def __init__(self, retention_minutes: int = 60):
+        self.retention_minutes = retention_minutes
+        self.last_id = None
+
+    def publish(self, cache_name: str, key: int):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO CacheInvalidations (cache_name, cache_key) VALUES (%s, %s)",
+                (cache_name, key)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def poll(self):
+        """Return invalidations published since the last poll."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if self.last_id is None:
+                # Start from the current end of the log; older entries predate our cache
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM CacheInvalidations")
+                self.last_id = cursor.fetchone()[0]
+                return []
+            cursor.execute(
+                "SELECT id, cache_name, cache_key FROM CacheInvalidations WHERE id > %s ORDER BY id LIMIT 1000",
+                (self.last_id,)
+            )
+            rows = cursor.fetchall()
+            if rows:
+                self.last_id = rows[-1][0]
+            return [(name, key) for _, name, key in rows]
+        finally:
+            cursor.close()
+            conn.close()
+
+    def prune(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "DELETE FROM CacheInvalidations WHERE created_at < NOW() - INTERVAL %s MINUTE",
+                (self.retention_minutes,)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+
+invalidation_channel = InvalidationChannel() if CACHE_INVALIDATION_POLL > 0 else None
+
+
+class ReadThroughCache:
+    """Bounded, TTL-limited cache of rarely written rows, loaded through run_db on a miss.
+
+    Only used from the event loop, so it needs no locking. A generation counter
+    stops a load that raced with an invalidation from storing the stale row.
+    """
+
+    def __init__(self, name: str, loader, max_size: int, ttl: float):
+        self.name = name
+        self.loader = loader
+        self.entries = LRUCache(max_size, ttl)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: int):
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        generation = self.generation
+        value = await run_db(self.loader, key)
+        if value is not None and generation == self.generation:
+            self.entries.set(key, value)
+        return value
+
+    def invalidate(self, key: int, broadcast: bool = True):
+        self.entries.invalidate(key)
+        self.generation += 1
+        if broadcast and invalidation_channel is not None:
+            spawn_task(run_db(invalidation_channel.publish, self.name, key))
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+conversation_owners = ReadThroughCache("conversation_owner", get_conversation_owner,
+                                       ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+supportive_message_owners = ReadThroughCache("supportive_message_owner", get_supportive_message_owner,
+                                             ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+preferences_cache = ReadThroughCache("preferences", get_user_preferences,
+                                     ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+entity_caches = {cache.name: cache for cache in (conversation_owners, supportive_message_owners, preferences_cache)}
+
+
+async def verify_conversation_owner(conversation_id: int, user_id: int):
+    """Verify that a conversation belongs to a user."""
+    if await conversation_owners.get(conversation_id) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
+
+
+async def verify_message_owner(message_id: int, user_id: int):
+    """Verify that a supportive message belongs to a user."""
+    if await supportive_message_owners.get(message_id) != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this message")
+
+
+async def run_invalidation_listener():
+    """Apply invalidations published by other workers until cancelled."""
+    polls = 0
+    while True:
+        await asyncio.sleep(CACHE_INVALIDATION_POLL)
+        try:
+            for name, key in await run_db(invalidation_channel.poll):
+                cache = entity_caches.get(name)
+                if cache is not None:
+                    cache.invalidate(key, broadcast=False)
+            polls += 1
+            # Trim the log now and then; entries only matter for a poll interval or two
+            if polls % 1000 == 0:
+                await run_db(invalidation_channel.prune)
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}")
+
+
 # Gemini prompt templates
 CHATBOT_SYSTEM_PROMPT = """
 You are a supportive, empathetic mental health companion in a mobile app. Your role is to:
@@ -490,15 +1671,58 @@ The supportive message should:
 Return only the notification text without any additional context or explanation.
 """
 
+SUMMARY_UPDATE_PROMPT = """
+You maintain a running summary of a supportive conversation between a user and an AI companion.
+Update the summary so it also covers the new messages below. Keep the user's key concerns,
+feelings, events and anything they asked to be remembered. Stay under 200 words and write
+in the third person.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Return only the updated summary.
+"""
+
+# Canned replies used when Gemini fails or times out
+AI_RESPONSE_FALLBACK = "I'm having trouble connecting to my thinking system. Could you please try again in a moment?"
+SUPPORTIVE_MESSAGE_FALLBACK = "Remember that you're stronger than you think. Take a moment for yourself today."
+
 
 # AI functions
-async def generate_ai_response(conversation_history, user_message):
-    """Generate an AI response using Gemini."""
-    model = genai.GenerativeModel(MODEL_NAME)
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def fit_context_to_budget(conversation_history, summary, user_message, budget=None):
+    """Drop the oldest recent messages until the prompt fits the token budget."""
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    used = estimate_tokens(CHATBOT_SYSTEM_PROMPT) + estimate_tokens(user_message)
+    if summary:
+        used += estimate_tokens(summary)
+
+    kept = []
+    for msg in reversed(conversation_history):
+        cost = estimate_tokens(msg["content"])
+        if used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    return list(reversed(kept))
+
+
+def build_chat(conversation_history, user_message, summary=None):
+    """Build the Gemini chat history and the prompt to send for the next turn."""
+    system_prompt = CHATBOT_SYSTEM_PROMPT
+    if summary:
+        system_prompt += "\nSummary of the earlier conversation:\n" + summary + "\n"
 
     # Build the conversation history in the format Gemini expects
     formatted_history = [
-        {"role": "user", "parts": ["START SYSTEM PROMPT\n" + CHATBOT_SYSTEM_PROMPT + "\nEND SYSTEM PROMPT"]}
+        {"role": "user", "parts": ["START SYSTEM PROMPT\n" + system_prompt + "\nEND SYSTEM PROMPT"]}
     ]
 
     for msg in conversation_history:
@@ -508,110 +1732,666 @@ async def generate_ai_response(conversation_history, user_message):
     # Add the current user message
     formatted_history.append({"role": "user", "parts": [user_message]})
 
+    prompt = formatted_history[0]["parts"][0] + "\n\n" + user_message
+    return formatted_history[1:], prompt
+
+
+async def generate_ai_response(conversation_history, user_message, summary=None):
+    """Generate an AI response using Gemini."""
     try:
-        chat = model.start_chat(history=formatted_history[1:])
-        response = await chat.send_message_async(formatted_history[0]["parts"][0] + "\n\n" + user_message)
-        return response.text
+        history, prompt = build_chat(conversation_history, user_message, summary)
+        return await gemini.send_chat(history, prompt)
     except Exception as e:
         # Fallback response in case of API errors
         print(f"Error generating AI response: {e}")
-        return "I'm having trouble connecting to my thinking system. Could you please try again in a moment?"
+        return AI_RESPONSE_FALLBACK
+
+
+async def stream_ai_response(conversation_history, user_message, summary=None):
+    """Yield the AI response text chunk by chunk as Gemini produces it."""
+    history, prompt = build_chat(conversation_history, user_message, summary)
+    async for text in gemini.stream_chat(history, prompt):
+        yield text
 
 
 async def generate_positive_reframe(user_message):
     """Generate a positive reframing of a user message."""
-    model = genai.GenerativeModel(MODEL_NAME)
     prompt = POSITIVE_REFRAMING_PROMPT.format(user_message=user_message)
 
+    async def load():
+        return await gemini.generate(prompt)
+
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text
+        return await llm_cache.get_or_load(make_cache_key("reframe", MODEL_NAME, user_message), load)
     except Exception as e:
         print(f"Error generating positive reframe: {e}")
         return None
 
 
+async def update_conversation_summary(summary, new_messages):
+    """Fold new messages into an existing conversation summary."""
+    lines = "\n".join(
+        f"{'User' if msg['is_user'] else 'AI'}: {msg['content']}" for msg in new_messages
+    )
+    prompt = SUMMARY_UPDATE_PROMPT.format(summary=summary or "(none yet)", messages=lines)
+
+    try:
+        return await gemini.generate(prompt)
+    except Exception as e:
+        print(f"Error updating conversation summary: {e}")
+        return None
+
+
 async def generate_supportive_message(conversation_summary):
-    """Generate a supportive message based on conversation history."""
-    model = genai.GenerativeModel(MODEL_NAME)
+    """Generate a supportive message based on conversation history.
+
+    Never cached: a user whose conversations have not changed should still get
+    a fresh message on each run.
+    """
     prompt = SUPPORTIVE_MESSAGE_PROMPT.format(conversation_summary=conversation_summary)
 
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text
+        return await gemini.generate(prompt)
     except Exception as e:
         print(f"Error generating supportive message: {e}")
-        return "Remember that you're stronger than you think. Take a moment for yourself today."
+        return SUPPORTIVE_MESSAGE_FALLBACK
 
 
-# Background tasks
-async def schedule_supportive_messages(background_tasks: BackgroundTasks = None):
-    """Background task to generate and send supportive messages to users."""
+# Chat pipeline helpers
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+_pending_tasks = set()
+
+
+def spawn_task(coro):
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+    return task
+
+
+async def generate_ai_response_with_timeout(conversation_history, user_message, summary=None):
+    """Generate the chat reply, falling back to the canned reply on timeout."""
+    try:
+        return await asyncio.wait_for(
+            generate_ai_response(conversation_history, user_message, summary), AI_RESPONSE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        print(f"AI response timed out after {AI_RESPONSE_TIMEOUT}s")
+        return AI_RESPONSE_FALLBACK
+
+
+async def attach_positive_reframe(reframe_task, message_id: int):
+    """Wait for a reframe and store it on the user message once it is ready."""
+    try:
+        positive_reframe = await asyncio.wait_for(reframe_task, REFRAME_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Positive reframe timed out after {REFRAME_TIMEOUT}s")
+        return
+    if positive_reframe:
+        await run_db(set_message_reframe, message_id, positive_reframe)
+
+
+# Conversations whose summary is currently being refreshed
+_summarizing = set()
+
+
+async def refresh_conversation_summary(conversation_id: int):
+    """Fold messages that have left the recent window into the rolling summary.
+
+    Only the messages newer than the last summarised one are read, so each
+    refresh costs one small query and at most one Gemini call.
+    """
+    if conversation_id in _summarizing:
+        return
+    _summarizing.add(conversation_id)
+    try:
+        summary_row = await run_db(get_conversation_summary, conversation_id)
+        summary = summary_row["summary"] if summary_row else None
+        through = summary_row["summarized_through"] if summary_row else 0
+
+        pending = await run_db(
+            get_messages_after, conversation_id, through,
+            CONTEXT_RECENT_MESSAGES + CONTEXT_SUMMARY_BATCH
+        )
+        overflow = pending[:len(pending) - CONTEXT_RECENT_MESSAGES]
+        if len(overflow) < CONTEXT_SUMMARY_BATCH:
+            return
+
+        new_summary = await update_conversation_summary(summary, overflow)
+        if new_summary:
+            await run_db(save_conversation_summary, conversation_id, new_summary, overflow[-1]["message_id"])
+    finally:
+        _summarizing.discard(conversation_id)
+
+
+# Admission control
+admission_rejected = tracing.registry.counter(
+    "feeltrack_admission_rejected_total", "Chat turns turned away with 429 by admission control")
+rate_limiter = RateLimiter(
+    SQLiteBucketStore(ADMISSION_SHARED_PATH) if ADMISSION_SHARED_PATH else MemoryBucketStore(),
+    ADMISSION_USER_RATE, ADMISSION_USER_BURST, ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST,
+    shared=bool(ADMISSION_SHARED_PATH),
+)
+# Interactive chat is served before background work, which may hold only its share
+# of the slots; a background job may wait up to half its scheduler lease
+admission = PriorityLimiter(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUED, {
+    "interactive": Lane(0, ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_WAIT),
+    "background": Lane(1, max(1, int(ADMISSION_MAX_IN_FLIGHT * ADMISSION_BACKGROUND_SHARE)),
+                       SCHEDULER_LEASE_SECONDS / 2),
+})
+
+
+async def admit_chat_turn(user_id: int):
+    """Admit a chat turn before any database or Gemini work, or raise a 429.
+
+    Returns a ticket whose release() frees the slot when the turn is finished.
+    """
+    try:
+        await rate_limiter.check(user_id)
+        return await admission.acquire("interactive")
+    except Rejected as e:
+        admission_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+# Message search
+search_index = SearchIndex(SEARCH_INDEX_DIR, EMBEDDING_DIM, max_loaded=SEARCH_LOADED_USERS)
+# A separate client, so indexing and search never spend the chat quota and
+# embedding failures never open the chat circuit breaker
+embedder = GeminiClient(
+    EMBEDDING_MODEL,
+    api_key=GEMINI_API_KEY,
+    requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+    burst=int(os.getenv("EMBEDDING_BURST", "20")),
+    max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+    observer=record_llm_call,
+)
+
+
+async def embed_text(text: str, task_type: str):
+    """Embed a text for the search index, or return None if Gemini is unavailable."""
+    try:
+        return await embedder.embed(text[:EMBEDDING_MAX_CHARS], task_type)
+    except Exception as e:
+        print(f"Error embedding text: {e}")
+        return None
+
+
+async def index_message(user_id: int, conversation_id: int, message: dict):
+    """Add a stored message to its owner's search index.
+
+    A message whose embedding fails is still indexed by keyword.
+    """
+    vector = await embed_text(message["content"], "retrieval_document")
+    entry = {
+        "message_id": message["message_id"],
+        "conversation_id": conversation_id,
+        "is_user": message["is_user"],
+        "content": message["content"],
+        "timestamp": message["timestamp"],
+    }
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, search_index.append, user_id, entry, vector)
+    except Exception as e:
+        print(f"Error indexing message {message['message_id']}: {e}")
+
+
+def find_existing_users(user_ids: List[int], batch_size: int = 500):
+    """Return the subset of `user_ids` that still have a row in Users."""
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
     try:
-        # Get users with notifications enabled who are due for a message
-        cursor.execute("""
-            SELECT u.user_id, up.notification_frequency, 
-                   (SELECT MAX(created_at) FROM SupportiveMessages WHERE user_id = u.user_id) as last_message,
-                   up.active_hours_start, up.active_hours_end
-            FROM Users u
-            JOIN UserPreferences up ON u.user_id = up.user_id
-            WHERE up.notifications_enabled = TRUE
-        """)
-        users = cursor.fetchall()
-
-        current_time = datetime.now().time()
-
-        for user in users:
-            # Check if user is within active hours
-            active_start = datetime.strptime(str(user["active_hours_start"]), "%H:%M:%S").time()
-            active_end = datetime.strptime(str(user["active_hours_end"]), "%H:%M:%S").time()
-
-            # Skip if outside active hours
-            if not (active_start <= current_time <= active_end):
-                continue
+        existing = set()
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"SELECT user_id FROM Users WHERE user_id IN ({placeholders})", batch)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+    finally:
+        cursor.close()
+        conn.close()
 
-            # Check if it's time for a new message
-            last_message_time = user.get("last_message")
-            frequency_minutes = user["notification_frequency"]
 
-            if last_message_time is None or (
-                    datetime.now() - last_message_time).total_seconds() >= frequency_minutes * 60:
-                # Get conversation summary and generate message
-                conversation_summary = get_recent_conversation_summary(user["user_id"])
+async def prune_search_index():
+    """Delete the search indexes of users who no longer exist. Returns how many were removed.
+
+    Users are removed in the database (their rows cascade), so the plaintext
+    copies in the index are swept up here rather than at deletion time.
+    """
+    loop = asyncio.get_running_loop()
+    user_ids = await loop.run_in_executor(None, search_index.user_ids)
+    if not user_ids:
+        return 0
+    existing = await run_db(find_existing_users, user_ids)
+    removed = [user_id for user_id in user_ids if user_id not in existing]
+    for user_id in removed:
+        await loop.run_in_executor(None, search_index.remove_user, user_id)
+    return len(removed)
+
+
+async def run_search_index_pruner():
+    """Periodic loop that prunes the search index until cancelled."""
+    while True:
+        try:
+            await prune_search_index()
+        except Exception as e:
+            print(f"Search index pruner error: {e}")
+        await asyncio.sleep(SEARCH_PRUNE_INTERVAL)
+
+
+async def start_chat_turn(message: MessageCreate):
+    """Resolve the conversation, store the user message and kick off its reframe.
+
+    Returns the conversation id, the recent turns that precede the new message
+    and the rolling summary of everything older.
+    """
+    # Save the user message (creating or ownership-checking the conversation) and load context
+    turn = await run_db(
+        begin_chat_turn, message.user_id, message.conversation_id, message.content,
+        CONTEXT_RECENT_MESSAGES
+    )
+
+    # Start the positive reframing right away so it runs alongside the chat reply.
+    # It is attached whenever it finishes, even after the reply has been returned.
+    reframe_task = asyncio.ensure_future(generate_positive_reframe(message.content))
+    spawn_task(attach_positive_reframe(reframe_task, turn["user_message_id"]))
+    spawn_task(index_message(message.user_id, turn["conversation_id"], {
+        "message_id": turn["user_message_id"], "content": message.content,
+        "is_user": True, "timestamp": turn["timestamp"],
+    }))
+
+    conversation_history = fit_context_to_budget(turn["recent"], turn["summary"], message.content)
+    return turn["conversation_id"], conversation_history, turn["summary"]
+
+
+def sse_event(event: str, data, event_id=None) -> str:
+    """Format a single Server-Sent Event."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+class SupportiveMessageHub:
+    """In-process pub/sub that pushes new supportive messages to open streams.
+
+    Each subscriber gets a bounded queue. A subscriber that falls behind is
+    disconnected rather than buffered without limit; its client reconnects
+    with Last-Event-ID and replays what it missed from the database.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.dropped = 0
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, user_id: int, message: dict):
+        for queue in list(self.subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Backpressure: cut the slow subscriber off; None tells its stream to close
+                self.dropped += 1
+                self.unsubscribe(user_id, queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def stats(self):
+        return {
+            "users": len(self.subscribers),
+            "streams": sum(len(queues) for queues in self.subscribers.values()),
+            "dropped": self.dropped,
+        }
+
+
+supportive_hub = SupportiveMessageHub(SUPPORTIVE_STREAM_QUEUE_SIZE)
+
+
+
+# Data export
+def encode_export_cursor(user_id: int, section: str, after) -> str:
+    """Encode an export position (section and keyset values) as an opaque cursor."""
+    raw = json.dumps({"user_id": user_id, "section": section, "after": after}, default=datetime.isoformat)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_export_cursor(user_id: int, cursor: str):
+    """Decode a cursor produced by encode_export_cursor back into (section, after)."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        section, after = raw["section"], raw["after"]
+        if raw["user_id"] != user_id or section not in EXPORT_SECTIONS:
+            raise ValueError(section)
+        if after is not None:
+            # Messages positions lead with the conversation and may be [id, None, None]
+            keys = EXPORT_SECTIONS[section][1]
+            length = len(keys) + 1 if section == "messages" else len(keys)
+            if not isinstance(after, list) or len(after) != length:
+                raise ValueError(after)
+            after = [datetime.fromisoformat(value) if isinstance(value, str) else value for value in after]
+            if section == "messages":
+                valid = isinstance(after[0], int) and (after[1:] == [None, None] or (
+                    isinstance(after[1], datetime) and isinstance(after[2], int)))
+            else:
+                valid = all(isinstance(value, (int, datetime)) and not isinstance(value, bool) for value in after)
+            if not valid:
+                raise ValueError(after)
+        return section, after
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def export_batches(user_id: int, section: str, after):
+    """Yield (section, rows, cursor) batches of a user's data from a position to the end.
+
+    The cursor points just past the batch's rows and is None after the last one.
+    """
+    sections = list(EXPORT_SECTIONS)
+    index = sections.index(section)
+    while index < len(sections):
+        name = sections[index]
+        rows, after = await run_db(read_export_batch, user_id, name, after, EXPORT_BATCH_SIZE)
+        if after is None:
+            index += 1
+        cursor = encode_export_cursor(user_id, sections[index], after) if index < len(sections) else None
+        yield name, rows, cursor
+
+
+async def export_ndjson(user_id: int, section: str, after):
+    """Stream an export as NDJSON: one line per row, then a checkpoint line per batch.
+
+    Resuming with the last checkpoint's cursor continues right after the rows
+    already received.
+    """
+    async for name, rows, cursor in export_batches(user_id, section, after):
+        lines = [json.dumps({"type": name, "data": row}) for row in jsonable_encoder(rows)]
+        if rows and cursor:
+            lines.append(json.dumps({"type": "cursor", "cursor": cursor}))
+        if lines:
+            yield "\n".join(lines) + "\n"
+    yield json.dumps({"type": "end"}) + "\n"
+
+
+class ChunkBuffer:
+    """Write-only file object that collects bytes for a streaming response to drain."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def export_zip(user_id: int, section: str, after, started_from: Optional[str]):
+    """Stream an export as a zip archive with one NDJSON file per section.
+
+    The archive is written sequentially (sizes go in data descriptors), so it
+    is sent as it is built and never held in memory.
+    """
+    buffer = ChunkBuffer()
+    archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+    entry, entry_section = None, None
+    async for name, rows, cursor in export_batches(user_id, section, after):
+        if name != entry_section:
+            if entry is not None:
+                entry.close()
+            entry, entry_section = archive.open(f"{name}.ndjson", "w", force_zip64=True), name
+        for row in jsonable_encoder(rows):
+            entry.write(json.dumps(row).encode() + b"\n")
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+    if entry is not None:
+        entry.close()
+    archive.writestr("export.json", json.dumps({
+        "user_id": user_id,
+        "exported_at": datetime.now().isoformat(),
+        "started_from": started_from,
+    }))
+    archive.close()
+    yield buffer.drain()
 
-                if conversation_summary != "No recent conversations":
-                    supportive_message = await generate_supportive_message(conversation_summary)
-                    create_supportive_message(user["user_id"], supportive_message)
+
+# Background tasks
+def claim_due_users(lease_owner: str, batch_size: int, lease_seconds: int,
+                    shard_count: int = 1, shard_index: int = 0):
+    """Lease a batch of users that are due a supportive message and return their IDs.
+
+    Active hours (including windows that wrap past midnight) and notification
+    frequency are evaluated in SQL, so only due users leave the database. The
+    lease keeps other workers from picking the same users until it expires.
+    `lease_owner` must be unique to this claim, so only the rows it leased are
+    returned, not leases still held from earlier runs.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            UPDATE UserPreferences
+            SET lease_owner = %s, lease_expires_at = NOW() + INTERVAL %s SECOND
+            WHERE notifications_enabled = TRUE
+              AND (next_notification_at IS NULL OR next_notification_at <= NOW())
+              AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+              AND (
+                    (active_hours_start <= active_hours_end AND CURTIME() BETWEEN active_hours_start AND active_hours_end)
+                 OR (active_hours_start > active_hours_end AND (CURTIME() >= active_hours_start OR CURTIME() <= active_hours_end))
+              )
+              AND MOD(user_id, %s) = %s
+            ORDER BY next_notification_at
+            LIMIT %s
+            """,
+            (lease_owner, lease_seconds, shard_count, shard_index, batch_size)
+        )
+        conn.commit()
+        cursor.execute(
+            "SELECT user_id FROM UserPreferences WHERE lease_owner = %s AND lease_expires_at > NOW()",
+            (lease_owner,)
+        )
+        return [row[0] for row in cursor.fetchall()]
     finally:
         cursor.close()
         conn.close()
 
 
+def complete_user_lease(user_id: int, lease_owner: str, retry_in: Optional[int] = None):
+    """Release a user's scheduler lease, pushing the next run out by their frequency,
+    or by `retry_in` seconds after a failed run."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if retry_in is None:
+            cursor.execute(
+                """
+                UPDATE UserPreferences
+                SET next_notification_at = NOW() + INTERVAL notification_frequency MINUTE,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE user_id = %s AND lease_owner = %s
+                """,
+                (user_id, lease_owner)
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE UserPreferences
+                SET next_notification_at = NOW() + INTERVAL %s SECOND,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE user_id = %s AND lease_owner = %s
+                """,
+                (retry_in, user_id, lease_owner)
+            )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+async def send_supportive_message(user_id: int, semaphore: asyncio.Semaphore, lease_owner: str):
+    """Generate and store one supportive message for a leased user. Returns whether it succeeded."""
+    async with semaphore:
+        try:
+            # Yields to interactive chat turns
+            async with admission.slot("background"):
+                conversation_summary = await run_db(get_recent_conversation_summary, user_id)
+                if conversation_summary != "No recent conversations":
+                    supportive_message = await generate_supportive_message(conversation_summary)
+                    stored = await run_db(create_supportive_message, user_id, supportive_message)
+                    supportive_hub.publish(user_id, stored)
+        except Rejected:
+            # Shed while chat is busy: keep the lease, so the user is retried once it
+            # expires (SCHEDULER_LEASE_SECONDS) instead of being re-claimed straight away
+            return False
+        except Exception as e:
+            print(f"Error sending supportive message to user {user_id}: {e}")
+            await run_db(complete_user_lease, user_id, lease_owner, retry_in=SCHEDULER_RETRY_DELAY)
+            return False
+        await run_db(complete_user_lease, user_id, lease_owner)
+        return True
+
+
+async def schedule_supportive_messages(worker_id: str):
+    """Generate supportive messages for every user this worker can lease right now.
+
+    Returns the number of users claimed and the number that succeeded.
+    """
+    # One token per claim; a lease kept after a shed job is not picked up again until it expires
+    lease_owner = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    user_ids = await run_db(
+        claim_due_users, lease_owner, SCHEDULER_BATCH_SIZE, SCHEDULER_LEASE_SECONDS,
+        SCHEDULER_SHARD_COUNT, SCHEDULER_SHARD_INDEX
+    )
+    semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+    results = await asyncio.gather(*(send_supportive_message(user_id, semaphore, lease_owner) for user_id in user_ids))
+    return len(user_ids), sum(results)
+
+
+async def run_supportive_message_scheduler(worker_id: str):
+    """Periodic loop that runs the supportive message scheduler until cancelled."""
+    while True:
+        try:
+            claimed, succeeded = await schedule_supportive_messages(worker_id)
+            # A full, clean batch means more users are waiting, so go again without sleeping.
+            # After any failure, wait out the interval rather than hammering a failing Gemini.
+            if claimed >= SCHEDULER_BATCH_SIZE and succeeded == claimed:
+                continue
+        except Exception as e:
+            print(f"Supportive message scheduler error: {e}")
+        await asyncio.sleep(SCHEDULER_INTERVAL)
+
 
-@app.post("/generate-image")
+# Story images
+_image_pipeline = None
+_image_pipeline_lock = threading.Lock()
+
+
+def load_image_pipeline():
+    """Load the diffusion pipeline on first use, so startup does not pay for the model."""
+    global _image_pipeline
+    with _image_pipeline_lock:
+        if _image_pipeline is None:
+            import torch
+            from diffusers import AutoPipelineForText2Image
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            _image_pipeline = AutoPipelineForText2Image.from_pretrained(IMAGE_MODEL).to(device)
+        return _image_pipeline
+
+
+def render_image(theme: str, path: str):
+    """Generate an image for a theme and save it as a PNG. Runs on an image worker thread."""
+    with tracing.span("render_image", "image"):
+        image = load_image_pipeline()(theme).images[0]
+    image.save(path, format="PNG")
+
+
+image_jobs = ImageJobQueue(render_image, IMAGE_OUTPUT_DIR, workers=IMAGE_WORKERS,
+                           max_queued=IMAGE_MAX_QUEUED)
+
+
+def image_job_response(job):
+    result = job.to_dict()
+    if job.status == "done":
+        result["image_url"] = f"/image-jobs/{job.job_id}/image"
+    return result
+
+
+@app.post("/generate-image", status_code=202)
 async def generate_image(request: GenerationRequest):
-    """Generate image based on theme and story_id."""
-    image = pipe(request.theme).images[0]
-    filename = f"{request.story_id}_generated_image.png"
-    image.save(filename)
-    
-    return {"message": "Image generated successfully", "file": filename}
+    """Queue image generation for a story theme and return the job.
+
+    Poll GET /image-jobs/{job_id} (optionally with `wait` to hold the request
+    until the job finishes) and fetch the result from its image_url.
+    """
+    if not IMAGE_GENERATION_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Image generation is not available on this server")
+    try:
+        job = image_jobs.submit(request.theme, request.story_id)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Image generation is busy, try again later",
+                            headers={"Retry-After": "10"})
+    return image_job_response(job)
+
+
+@app.get("/image-jobs/{job_id}")
+async def get_image_job(job_id: str, wait: float = Query(0, ge=0, le=30)):
+    """Get the status of an image job, waiting up to `wait` seconds for it to finish."""
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+    if wait:
+        await image_jobs.wait(job, wait)
+    return image_job_response(job)
+
+
+@app.get("/image-jobs/{job_id}/image")
+async def get_image_job_image(job_id: str):
+    """Download the image produced by a finished job."""
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Image job is {job.status}")
+    return FileResponse(job.path, media_type="image/png",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 
 # API endpoints
 @app.post("/register", response_model=UserResponse)
 async def register(user: UserCreate):
     """Register a new user."""
-    user_id = create_user(user.username, user.email, user.password)
+    hashed_password = await hash_password(user.password)
+    user_id = await run_db(create_user, user.username, user.email, hashed_password)
     return {"user_id": user_id, "username": user.username, "email": user.email}
 
 
 @app.post("/login", response_model=UserResponse)
 async def login(login_data: UserLogin):
     """Login and return user info."""
-    user = authenticate_user(login_data.username, login_data.password)
+    user = await authenticate_user(login_data.username, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -623,14 +2403,39 @@ async def login(login_data: UserLogin):
 @app.get("/users/{user_id}", response_model=UserResponse)
 async def get_user_info(user_id: int):
     """Get user information by ID."""
-    return get_user(user_id)
+    return await run_db(get_user, user_id)
 
 
 @app.get("/users/{user_id}/conversations", response_model=List[ConversationResponse])
-async def list_conversations(user_id: int):
-    """Get all conversations for a user."""
-    conversations = get_conversations(user_id)
-    return conversations
+async def list_conversations(
+        user_id: int,
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=500),
+        before: Optional[str] = None,
+        since: Optional[str] = None
+):
+    """Get conversations for a user.
+
+    Without `limit`, `before` or `since` every conversation is returned. Otherwise
+    one page is returned, with `X-Next-Cursor` pointing at the next (older) page
+    and `X-Sync-Cursor` to pass as `since` on the next delta sync. Responses
+    carry an ETag; send it back in If-None-Match to get 304 when nothing changed.
+    """
+    headers = {}
+    if limit is None and before is None and since is None:
+        conversations = await run_db(get_conversations, user_id)
+    else:
+        limit = limit or 50
+        conversations = await run_db(get_conversations_page, user_id, limit, before, since)
+        if conversations:
+            newest, oldest = (conversations[-1], conversations[0]) if since else (conversations[0], conversations[-1])
+            headers["X-Sync-Cursor"] = encode_cursor(newest["updated_at"], newest["conversation_id"])
+            if not since and len(conversations) == limit:
+                headers["X-Next-Cursor"] = encode_cursor(oldest["updated_at"], oldest["conversation_id"])
+        elif since:
+            headers["X-Sync-Cursor"] = since
+    etag = rows_etag(conversations, "conversation_id", "title", "updated_at")
+    return rows_response(request, conversations, etag, headers=headers)
 
 
 @app.post("/users/{user_id}/conversations", response_model=ConversationResponse)
@@ -639,88 +2444,207 @@ async def create_new_conversation(
         title: str = "New Conversation"
 ):
     """Create a new conversation."""
-    conversation_id = create_conversation(user_id, title)
+    conversation_id = await run_db(create_conversation, user_id, title)
 
     # Get the created conversation details
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            "SELECT conversation_id, title, created_at, updated_at FROM Conversations WHERE conversation_id = %s",
-            (conversation_id,)
-        )
-        conversation = cursor.fetchone()
-        return conversation
-    finally:
-        cursor.close()
-        conn.close()
+    return await run_db(get_conversation, conversation_id)
 
 
 @app.get("/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
 async def list_messages(
         conversation_id: int,
-        user_id: int  # Now explicitly passed as a query parameter
+        user_id: int,  # Now explicitly passed as a query parameter
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=500),
+        before: Optional[str] = None,
+        since: Optional[str] = None
 ):
-    """Get all messages in a conversation."""
+    """Get messages in a conversation.
+
+    Without `limit`, `before` or `since` the whole history is returned. Otherwise
+    one page is returned oldest first, with `X-Next-Cursor` pointing at the page
+    of older messages and `X-Sync-Cursor` to pass as `since` on the next delta sync.
+    Responses carry an ETag; send it back in If-None-Match to get 304 when
+    nothing changed.
+    """
     # Verify the conversation belongs to the user
-    verify_conversation_owner(conversation_id, user_id)
+    await verify_conversation_owner(conversation_id, user_id)
 
-    messages = get_messages(conversation_id)
-    return messages
+    headers = {}
+    if limit is None and before is None and since is None:
+        messages = await run_db(get_messages, conversation_id)
+    else:
+        limit = limit or 50
+        messages = await run_db(get_messages_page, conversation_id, limit, before, since)
+        if messages:
+            oldest, newest = messages[0], messages[-1]
+            headers["X-Sync-Cursor"] = encode_cursor(newest["timestamp"], newest["message_id"])
+            if not since and len(messages) == limit:
+                headers["X-Next-Cursor"] = encode_cursor(oldest["timestamp"], oldest["message_id"])
+        elif since:
+            headers["X-Sync-Cursor"] = since
+    # Message text never changes, but a reframe can be attached after the message is stored
+    etag = rows_etag(messages, "message_id", "positive_reframe")
+    return rows_response(request, messages, etag, bool_fields=("is_user",), headers=headers)
 
 
 @app.post("/conversations/message", response_model=List[MessageResponse])
-async def send_message(
-        message: MessageCreate,
-        background_tasks: BackgroundTasks
-):
+async def send_message(message: MessageCreate):
     """Send a message and get AI response."""
-    user_id = message.user_id
-
-    # Create a new conversation if none specified
-    conversation_id = message.conversation_id
-    if not conversation_id:
-        conversation_id = create_conversation(user_id)
-    else:
-        # Verify the conversation belongs to the user
-        verify_conversation_owner(conversation_id, user_id)
+    ticket = await admit_chat_turn(message.user_id)
+    try:
+        conversation_id, conversation_history, summary = await start_chat_turn(message)
 
-    # Generate positive reframing of user message
-    positive_reframe = await generate_positive_reframe(message.content)
+        # Generate and save AI response
+        ai_response = await generate_ai_response_with_timeout(conversation_history, message.content, summary)
+        ai_message = await run_db(finish_chat_turn, conversation_id, ai_response)
+    finally:
+        ticket.release()
+    spawn_task(refresh_conversation_summary(conversation_id))
+    spawn_task(index_message(message.user_id, conversation_id, ai_message))
 
-    # Save user message
-    user_message_id = create_message(conversation_id, message.content, True, positive_reframe)
+    return [ai_message]
 
-    # Get conversation history for context
-    conversation_history = get_messages(conversation_id)
 
-    # Generate and save AI response
-    ai_response = await generate_ai_response(conversation_history, message.content)
-    ai_message_id = create_message(conversation_id, ai_response, False)
-    # Schedule background task to generate supportive messages
-    background_tasks.add_task(schedule_supportive_messages)
+@app.post("/conversations/message/stream")
+async def send_message_stream(
+        message: MessageCreate,
+        request: Request
+):
+    """Send a message and stream the AI response as Server-Sent Events.
 
-    # Get the new messages
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    Emits one `token` event per chunk, then a `done` event carrying the stored
+    AI message. If the client disconnects, upstream generation is cancelled and
+    nothing is stored for the reply.
+    """
+    ticket = await admit_chat_turn(message.user_id)
     try:
+        conversation_id, conversation_history, summary = await start_chat_turn(message)
+    except BaseException:
+        ticket.release()
+        raise
+
+    async def event_stream():
+        chunks = []
+        upstream = stream_ai_response(conversation_history, message.content, summary)
+        try:
+            try:
+                async for text in upstream:
+                    if await request.is_disconnected():
+                        # Stop pulling from Gemini so a dropped client does not burn quota
+                        return
+                    chunks.append(text)
+                    yield sse_event("token", {"text": text})
+            except Exception as e:
+                print(f"Error streaming AI response: {e}")
+                if not chunks:
+                    chunks.append(AI_RESPONSE_FALLBACK)
+                    yield sse_event("token", {"text": AI_RESPONSE_FALLBACK})
+            finally:
+                # Closing the generator releases the upstream Gemini stream, also on cancellation
+                await upstream.aclose()
+
+            ai_message = await run_db(finish_chat_turn, conversation_id, "".join(chunks))
+        finally:
+            ticket.release()
+        spawn_task(refresh_conversation_summary(conversation_id))
+        spawn_task(index_message(message.user_id, conversation_id, ai_message))
+        yield sse_event("done", {"conversation_id": conversation_id, "message": ai_message})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Frees the slot even if the stream never started (release is idempotent)
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@app.get("/users/{user_id}/search")
+async def search_messages(
+        user_id: int,
+        q: str = Query(..., min_length=1, max_length=500),
+        limit: int = Query(10, ge=1, le=50)
+):
+    """Search all of a user's messages by keyword and by meaning.
 
-        cursor.execute(
-            "SELECT message_id, content, is_user, positive_reframe, timestamp FROM Messages WHERE message_id =  %s",
-            (ai_message_id,)
-        )
-        new_messages = cursor.fetchall()
-        return new_messages
-    finally:
-        cursor.close()
-        conn.close()
+    Served from the user's local search index, not from MySQL. Falls back to
+    keyword matching alone when the query cannot be embedded.
+    """
+    query_vector = await embed_text(q, "retrieval_query")
+    return await asyncio.get_running_loop().run_in_executor(
+        None, search_index.search, user_id, q, query_vector, limit
+    )
 
 
 @app.get("/users/{user_id}/supportive-messages", response_model=List[SupportiveMessageResponse])
-async def get_supportive_messages(user_id: int):
+async def get_supportive_messages(user_id: int, request: Request):
     """Get unread supportive messages for a user."""
-    messages = get_unread_supportive_messages(user_id)
-    return messages
+    messages = await run_db(get_unread_supportive_messages, user_id)
+    return rows_response(request, messages, rows_etag(messages, "message_id"), bool_fields=("is_read",))
+
+
+@app.get("/users/{user_id}/supportive-messages/stream")
+async def stream_supportive_messages(
+        user_id: int,
+        request: Request,
+        last_event_id: Optional[int] = None
+):
+    """Push new supportive messages to the client as Server-Sent Events.
+
+    Each message is sent as a `supportive-message` event whose id is the
+    message_id. On reconnect, unread messages after the Last-Event-ID header (or
+    `last_event_id` query parameter) are replayed first. A comment line is sent
+    every SUPPORTIVE_STREAM_HEARTBEAT seconds to keep idle connections open.
+    """
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+
+    # A fresh stream starts after the newest stored message, which the client loads over
+    # REST. Read before subscribing: anything stored in between is found by the catch-up.
+    start_after = last_event_id if last_event_id is not None else await run_db(
+        get_latest_supportive_message_id, user_id)
+
+    # Subscribe before replaying so nothing published in between is missed
+    queue = supportive_hub.subscribe(user_id)
+
+    async def event_stream():
+        last_sent = start_after
+        try:
+            yield f"retry: {int(SUPPORTIVE_STREAM_HEARTBEAT * 1000)}\n\n"
+            if last_event_id is not None:
+                for message in await run_db(get_unread_supportive_messages_after, user_id, last_event_id):
+                    last_sent = max(last_sent, message["message_id"])
+                    yield sse_event("supportive-message", message, message["message_id"])
+
+            loop = asyncio.get_running_loop()
+            next_catchup = loop.time() + SUPPORTIVE_STREAM_CATCHUP
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), SUPPORTIVE_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    if SUPPORTIVE_STREAM_CATCHUP and loop.time() >= next_catchup:
+                        next_catchup = loop.time() + SUPPORTIVE_STREAM_CATCHUP
+                        for missed in await run_db(get_unread_supportive_messages_after, user_id, last_sent):
+                            last_sent = missed["message_id"]
+                            yield sse_event("supportive-message", missed, missed["message_id"])
+                    continue
+                if message is None:
+                    # Dropped for falling behind; the client reconnects and replays
+                    return
+                if message["message_id"] > last_sent:
+                    last_sent = message["message_id"]
+                    yield sse_event("supportive-message", message, message["message_id"])
+        finally:
+            supportive_hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.put("/supportive-messages/{message_id}/read")
@@ -730,16 +2654,83 @@ async def mark_message_read(
 ):
     """Mark a supportive message as read."""
     # Verify the message belongs to the user
-    verify_message_owner(message_id, user_id)
+    await verify_message_owner(message_id, user_id)
 
-    mark_supportive_message_read(message_id)
+    await run_db(mark_supportive_messages_read, user_id, message_ids=[message_id])
     return {"status": "success"}
 
 
+@app.put("/users/{user_id}/supportive-messages/read")
+async def mark_messages_read(user_id: int, request: SupportiveMessagesRead):
+    """Mark several supportive messages as read in one request.
+
+    Pass either `message_ids` or `up_to_message_id` (marks everything up to and
+    including that message). Messages that do not belong to the user are ignored.
+    """
+    if (request.message_ids is None) == (request.up_to_message_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of message_ids or up_to_message_id")
+    if request.message_ids is not None and len(request.message_ids) > BULK_READ_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_READ_MAX_IDS} message IDs per request")
+
+    updated = await run_db(
+        mark_supportive_messages_read, user_id,
+        message_ids=request.message_ids, up_to_message_id=request.up_to_message_id
+    )
+    return {"status": "success", "updated": updated}
+
+
+@app.get("/users/{user_id}/supportive-messages/unread-count")
+async def get_unread_count(user_id: int):
+    """Get the number of unread supportive messages for a user."""
+    count = await run_db(get_unread_supportive_count, user_id)
+    if count is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"unread_count": count}
+
+
+@app.post("/users/{user_id}/check-ins")
+async def add_check_in(user_id: int, check_in: CheckInCreate):
+    """Record a daily check-in (emotion plus optional notes)."""
+    if check_in.emotion not in EMOTION_SCORES:
+        raise HTTPException(status_code=400, detail=f"Unknown emotion, expected one of: {', '.join(EMOTION_SCORES)}")
+    return await run_db(create_check_in, user_id, check_in.emotion, check_in.notes)
+
+
+@app.get("/users/{user_id}/check-ins/weekly")
+async def get_weekly_wrap(user_id: int, week: Optional[date] = None):
+    """Get the mood summary for a week (the week containing `week`, default the current one)."""
+    start = week_start(week or datetime.now().date())
+    days, emotions = await run_db(get_weekly_rollups, user_id, start)
+
+    by_day = {row["day"]: row for row in days}
+    daily = []
+    for offset in range(7):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day)
+        daily.append({
+            "day": day,
+            "weekday": day.strftime("%a"),
+            "check_ins": row["check_ins"] if row else 0,
+            "average_mood": round(row["mood_total"] / row["check_ins"], 2) if row else None,
+        })
+
+    total = sum(row["check_ins"] for row in days)
+    mood_total = sum(row["mood_total"] for row in days)
+    return {
+        "week_start": start,
+        "days": daily,
+        "emotions": [{"emotion": row["emotion"], "count": row["check_ins"]} for row in emotions],
+        "total_check_ins": total,
+        "days_checked_in": len(days),
+        "average_mood": round(mood_total / total, 2) if total else None,
+        "most_frequent_emotion": emotions[0]["emotion"] if emotions else None,
+    }
+
+
 @app.get("/users/{user_id}/preferences", response_model=dict)
 async def get_preferences(user_id: int):
     """Get user preferences."""
-    preferences = get_user_preferences(user_id)
+    preferences = await preferences_cache.get(user_id)
     return preferences
 
 
@@ -749,26 +2740,209 @@ async def update_preferences(
         preferences: UserPreferencesUpdate
 ):
     """Update user preferences."""
-    update_user_preferences(user_id, preferences.dict(exclude_unset=True))
-    updated_prefs = get_user_preferences(user_id)
+    await run_db(update_user_preferences, user_id, preferences.dict(exclude_unset=True))
+    preferences_cache.invalidate(user_id)
+    updated_prefs = await preferences_cache.get(user_id)
     return updated_prefs
 
 
-@app.get("/health")
-async def health_check():
-    """API health check endpoint."""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+@app.get("/users/{user_id}/export")
+async def export_user_data(user_id: int, cursor: Optional[str] = None):
+    """Stream all of a user's data (preferences, conversations, messages,
+    supportive messages and check-ins) as NDJSON.
+
+    Rows are read in keyset batches, so memory use does not grow with the
+    user's history. After each batch a `{"type": "cursor"}` line is sent; pass
+    its cursor to resume an interrupted export. The last line is `{"type": "end"}`.
+    """
+    section, after = decode_export_cursor(user_id, cursor) if cursor else (next(iter(EXPORT_SECTIONS)), None)
+    return StreamingResponse(
+        export_ndjson(user_id, section, after),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="feeltrack-export-{user_id}.ndjson"'},
+    )
+
+
+@app.get("/users/{user_id}/export.zip")
+async def export_user_data_zip(user_id: int, cursor: Optional[str] = None):
+    """Stream the same export as a zip archive with one NDJSON file per section.
+
+    A `cursor` from the NDJSON export starts the archive at that position.
+    """
+    section, after = decode_export_cursor(user_id, cursor) if cursor else (next(iter(EXPORT_SECTIONS)), None)
+    return StreamingResponse(
+        export_zip(user_id, section, after, cursor),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="feeltrack-export-{user_id}.zip"'},
+    )
+
+
+def sample_gauges():
+    """Pool, cache and Gemini client state sampled at scrape time."""
+    pool_stats = pool.stats()
+    cache_stats = llm_cache.stats()
+    gemini_stats = gemini.stats()
+    return {
+        "feeltrack_db_pool_in_use": pool_stats["in_use"],
+        "feeltrack_db_pool_size": pool_stats["size"],
+        "feeltrack_db_pool_checkouts": pool_stats["checkouts"],
+        "feeltrack_db_pool_timeouts": pool_stats["timeouts"],
+        "feeltrack_db_pool_wait_avg_ms": pool_stats["avg_wait_ms"],
+        "feeltrack_llm_cache_hits": cache_stats["hits"] + cache_stats["coalesced"],
+        "feeltrack_llm_cache_misses": cache_stats["misses"],
+        "feeltrack_gemini_in_flight": gemini_stats["in_flight"],
+        "feeltrack_gemini_circuit_open": int(gemini_stats["circuit"] != "closed"),
+    }
+
+
+tracing.registry.gauges(sample_gauges)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(tracing.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def ping_database():
+    """Check that a pooled connection can run a query."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and its event loop is responsive."""
+    return {"status": "ok"}
 
-# Start the background task to send supportive messages
-@app.on_event("startup")
-async def startup_event():
-    background_tasks = BackgroundTasks()
-    background_tasks.add_task(schedule_supportive_messages)
+
+@app.get("/health/ready")
+async def readiness_check(response: Response):
+    """Readiness probe: warm-up has finished and the database answers."""
+    checks = {"warmed_up": warm_up_done.is_set(), "gemini": gemini.ready, "database": False}
+    if checks["warmed_up"]:
+        try:
+            await asyncio.wait_for(run_db(ping_database), READINESS_TIMEOUT)
+            checks["database"] = True
+        except Exception as e:
+            print(f"Readiness check failed: {e}")
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if ready else "not ready", "checks": checks}
+
+
+@app.get("/health")
+async def health_check():
+    """API health check endpoint (liveness plus monitoring counters)."""
+    return {"status": "ok", "ready": warm_up_done.is_set() and pool.ready and gemini.ready,
+            "timestamp": datetime.now().isoformat(), "db_pool": pool.stats(),
+            "llm_cache": llm_cache.stats(), "gemini": gemini.stats(),
+            "entity_caches": {name: cache.stats() for name, cache in entity_caches.items()},
+            "supportive_streams": supportive_hub.stats(), "image_jobs": image_jobs.stats(),
+            "search_index": search_index.stats(), "embeddings": embedder.stats(), "admission": admission.stats()}
+
+
+# Worker lifecycle
+warm_up_done = asyncio.Event()
+
+
+async def warm_up():
+    """Build the Gemini client and open database connections off the event loop.
+
+    Runs in the background so the worker accepts requests (and answers
+    liveness probes) at once; readiness turns green when this finishes. A
+    failure is logged and left to the lazy paths to retry on first use.
+    """
+    loop = asyncio.get_running_loop()
+    for name, step in (("gemini", gemini.warm_up), ("database", pool.warm_up)):
+        try:
+            await loop.run_in_executor(None, step)
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+    warm_up_done.set()
+
+
+def preload():
+    """Import heavy modules before forking so workers share them copy-on-write.
+
+    Only imports: clients, connections and threads are created per worker.
+    """
+    from gemini_client import load_sdk, retryable_errors
+    load_sdk()
+    retryable_errors()
+
+
+def worker_identity() -> str:
+    """Name this worker for scheduler leases. Called after fork: preloaded workers
+    share the master's import-time state, and PIDs can repeat across hosts and restarts."""
+    return f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def start_background_work():
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+    if trace_exporter is not None:
+        trace_exporter.start()
+    app.state.scheduler_task = asyncio.create_task(run_supportive_message_scheduler(worker_identity()))
+    app.state.write_behind_task = asyncio.create_task(run_write_behind())
+    image_jobs.start()
+    if ARCHIVE_AFTER_DAYS > 0:
+        app.state.archiver_task = asyncio.create_task(run_message_archiver())
+    if invalidation_channel is not None:
+        app.state.invalidation_task = asyncio.create_task(run_invalidation_listener())
+    if SEARCH_PRUNE_INTERVAL > 0:
+        app.state.search_pruner_task = asyncio.create_task(run_search_index_pruner())
+
+
+async def stop_background_work():
+    app.state.warm_up_task.cancel()
+    app.state.scheduler_task.cancel()
+    app.state.write_behind_task.cancel()
+    if invalidation_channel is not None:
+        app.state.invalidation_task.cancel()
+    if ARCHIVE_AFTER_DAYS > 0:
+        app.state.archiver_task.cancel()
+    if SEARCH_PRUNE_INTERVAL > 0:
+        app.state.search_pruner_task.cancel()
+    await image_jobs.stop()
+    # Persist any timestamp bumps still buffered in memory
+    await flush_write_behind()
+
+
+def serve_prefork(host: str, port: int, workers: int):
+    """Load the app once, then fork worker processes that share it (needs gunicorn)."""
+    from gunicorn.app.base import BaseApplication
+
+    class PreforkServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+
+        def load(self):
+            return app
+
+    preload()
+    PreforkServer().run()
 
 
 if __name__ == "__main__":
     import uvicorn
     #print(GEMINI_API_KEY)
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if WEB_CONCURRENCY > 1:
+        if importlib.util.find_spec("gunicorn") is not None:
+            serve_prefork("0.0.0.0", 8001, WEB_CONCURRENCY)
+        else:
+            # Without gunicorn every worker imports the app on its own
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            uvicorn.run("fastapi-app:app", host="0.0.0.0", port=8001, workers=WEB_CONCURRENCY)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
 
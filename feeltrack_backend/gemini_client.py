@@ -0,0 +1,324 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+
+
+def load_sdk():
+    """Import the Gemini SDK. Deferred because it pulls in grpc and protobuf."""
+    import google.generativeai as genai
+    return genai
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_errors():
+    """Errors worth retrying: quota, overload and transient server failures."""
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def breaker_errors():
+    """Errors that say the API itself is unhealthy, and so count toward opening the breaker.
+
+    Anything else (a blocked response, an invalid argument, a bad prompt) is a
+    problem with that one call and is raised without a verdict on the API.
+    """
+    from google.api_core import exceptions as google_exceptions
+    return retryable_errors() + (
+        google_exceptions.ServerError,
+        asyncio.TimeoutError,
+        TimeoutError,
+        ConnectionError,
+    )
+
+
+def _history_text(history, prompt: str) -> str:
+    """Flatten a chat history and prompt into the text that is sent upstream."""
+    parts = [part for turn in history for part in turn["parts"]]
+    return "\n".join(parts + [prompt])
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Async token bucket that spaces calls out to stay within a request quota."""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single trial call through after a cool-down."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        if state == "half-open":
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a half-open trial without a verdict, e.g. when the call was cancelled."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """Shared Gemini client with rate limiting, bounded concurrency, retries and a circuit breaker.
+
+    One GenerativeModel is built up front and reused for every call. Every call
+    waits for a rate-limit token and a concurrency slot, retries transient
+    errors with jittered exponential backoff, and fails fast with
+    CircuitOpenError while the API is degraded so callers can use their
+    canned fallbacks.
+
+    If given, `observer(operation, seconds, prompt, response, error)` is called
+    once per logical call (after retries) for tracing and metrics.
+
+    The SDK is imported and the model built on first use (or by warm_up()),
+    so creating the client is cheap.
+    """
+
+    def __init__(self, model_name: str, api_key: str = None, requests_per_minute: float = 60,
+                 burst: int = 10, max_concurrency: int = 8, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, observer=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._configured = False
+        self._model_lock = threading.Lock()
+        self.rate_limiter = TokenBucket(requests_per_minute, burst)
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.observer = observer
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def sdk(self):
+        """The SDK module, configured with this client's API key."""
+        if not self._configured:
+            with self._model_lock:
+                if not self._configured:
+                    load_sdk().configure(api_key=self.api_key)
+                    self._configured = True
+        return load_sdk()
+
+    @property
+    def model(self):
+        if self._model is None:
+            genai = self.sdk()
+            with self._model_lock:
+                if self._model is None:
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    @property
+    def ready(self):
+        return self._model is not None
+
+    def warm_up(self):
+        """Import the SDK and build the model ahead of the first call. Blocks."""
+        return self.model
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying workers from stampeding the API in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _observe(self, operation, start, prompt, response, error):
+        if self.observer is not None:
+            self.observer(operation, time.perf_counter() - start, prompt, response, error)
+
+    async def _call(self, operation, prompt, make_request):
+        start = time.perf_counter()
+        try:
+            result = await self._call_with_retries(make_request)
+        except Exception as e:
+            self._observe(operation, start, prompt, None, e)
+            raise
+        self._observe(operation, start, prompt, result, None)
+        return result
+
+    async def _call_with_retries(self, make_request):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+
+        attempt = 0
+        while True:
+            try:
+                await self.rate_limiter.acquire()
+                async with self.semaphore:
+                    self.calls += 1
+                    self.in_flight += 1
+                    try:
+                        result = await make_request()
+                    finally:
+                        self.in_flight -= 1
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except retryable_errors():
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise
+                attempt += 1
+                self.retries += 1
+                try:
+                    await asyncio.sleep(self._backoff(attempt))
+                except asyncio.CancelledError:
+                    self.breaker.release_trial()
+                    raise
+                continue
+            except breaker_errors():
+                self.failures += 1
+                self.breaker.record_failure()
+                raise
+            except Exception:
+                self.failures += 1
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def generate(self, prompt: str) -> str:
+        """Generate a single completion for a prompt."""
+        async def request():
+            response = await self.model.generate_content_async(prompt)
+            return response.text
+        return await self._call("generate", prompt, request)
+
+    async def send_chat(self, history, prompt: str) -> str:
+        """Send the next turn of a chat and return the full reply."""
+        async def request():
+            # A fresh session per attempt so a failed attempt never leaks into the history
+            chat = self.model.start_chat(history=history)
+            response = await chat.send_message_async(prompt)
+            return response.text
+        return await self._call("chat", _history_text(history, prompt), request)
+
+    async def stream_chat(self, history, prompt: str):
+        """Send the next turn of a chat and yield the reply as it is generated.
+
+        Streams are not retried, since part of the reply may already have been
+        forwarded to the client.
+        """
+        start = time.perf_counter()
+        prompt_text = _history_text(history, prompt)
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            self.rejected += 1
+            self._observe("chat_stream", start, prompt_text, None, e)
+            raise
+
+        received = []
+        try:
+            await self.rate_limiter.acquire()
+            async with self.semaphore:
+                self.calls += 1
+                self.in_flight += 1
+                try:
+                    chat = self.model.start_chat(history=history)
+                    response = await chat.send_message_async(prompt, stream=True)
+                    async for chunk in response:
+                        if chunk.text:
+                            received.append(chunk.text)
+                            yield chunk.text
+                finally:
+                    self.in_flight -= 1
+        except Exception as e:
+            self.failures += 1
+            if isinstance(e, breaker_errors()):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_trial()
+            self._observe("chat_stream", start, prompt_text, "".join(received), e)
+            raise
+        except BaseException:
+            # Cancelled or closed by the consumer: no verdict on the API's health
+            self.breaker.release_trial()
+            self._observe("chat_stream", start, prompt_text, "".join(received), None)
+            raise
+        self.breaker.record_success()
+        self._observe("chat_stream", start, prompt_text, "".join(received), None)
+
+    async def embed(self, text: str, task_type: str):
+        """Embed a text with the client's model, which must be an embedding model."""
+        async def request():
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, functools.partial(
+                self.sdk().embed_content, model=self.model_name, content=text, task_type=task_type))
+            return result["embedding"]
+        return await self._call("embed", text, request)
+
+    def stats(self):
+        """Counters and breaker state for monitoring."""
+        return {
+            "model": self.model_name,
+            "circuit": self.breaker.state,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
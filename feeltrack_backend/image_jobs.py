@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+KEY_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def image_key(theme: str, story_id: int) -> str:
+    """Content address of a generated image: the same theme and story give the same file."""
+    raw = f"{story_id}\x00{' '.join(theme.casefold().split())}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the backlog of queued jobs is at its limit."""
+
+
+class ImageJob:
+    def __init__(self, key: str, theme: str, story_id: int):
+        # The job is named by its image's content address, so any worker can find the result
+        self.job_id = key
+        self.key = key
+        self.theme = theme
+        self.story_id = story_id
+        self.status = "queued"
+        self.path = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "story_id": self.story_id,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class ImageJobQueue:
+    """Runs image generation jobs on a small worker pool, off the event loop.
+
+    submit() returns a job straight away. A bounded asyncio queue feeds
+    `workers` tasks, each of which hands the blocking `render(theme, path)`
+    call to a dedicated thread pool of the same size, so the API keeps serving
+    requests while images are generated. Results are stored under a
+    content-addressed file name, so a repeated request for the same theme and
+    story is answered from disk, and a request for an image that is already
+    being generated joins the running job instead of starting another.
+
+    Queued and running jobs are only known to the process that accepted them.
+    A finished job is found by any process sharing `output_dir`, since its ID
+    is the image's content address.
+    """
+
+    def __init__(self, render, output_dir: str, workers: int = 1, max_queued: int = 20,
+                 max_jobs: int = 1000):
+        self.render = render
+        self.output_dir = output_dir
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._tasks = []
+        self.generated = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.output_dir, f"{key}.png")
+
+    def submit(self, theme: str, story_id: int) -> ImageJob:
+        key = image_key(theme, story_id)
+        active = self._active.get(key)
+        if active is not None:
+            return active
+
+        job = ImageJob(key, theme, story_id)
+        path = self.path_for(key)
+        if os.path.exists(path):
+            self.cache_hits += 1
+            self._finish(job, "done", path=path)
+        else:
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                raise QueueFullError("Too many image jobs queued")
+            self._active[key] = job
+        self._remember(job)
+        return job
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is None and KEY_RE.fullmatch(job_id) and os.path.exists(self.path_for(job_id)):
+            # Finished by another worker; theme and story are not known here
+            job = ImageJob(job_id, None, None)
+            self._finish(job, "done", path=self.path_for(job_id))
+        return job
+
+    async def wait(self, job: ImageJob, timeout: float):
+        """Wait up to `timeout` seconds for a job to finish."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def _remember(self, job):
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _finish(self, job, status, path=None, error=None):
+        job.status = status
+        job.path = path
+        job.error = error
+        job.finished_at = time.time()
+        job.done.set()
+
+    def _render_to_file(self, job):
+        path = self.path_for(job.key)
+        # Write to a temporary name so a half-written file is never served or cached
+        tmp_path = f"{path}.{job.job_id}.tmp"
+        try:
+            self.render(job.theme, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                path = await loop.run_in_executor(self.executor, self._render_to_file, job)
+                self.generated += 1
+                self._finish(job, "done", path=path)
+            except asyncio.CancelledError:
+                self._finish(job, "failed", error="Image generation was cancelled")
+                raise
+            except Exception as e:
+                print(f"Error generating image for story {job.story_id}: {e}")
+                self.failed += 1
+                self._finish(job, "failed", error=str(e))
+            finally:
+                self._active.pop(job.key, None)
+                self._queue.task_done()
+
+    def stats(self):
+        """Queue depth and counters for monitoring."""
+        return {
+            "queued": self._queue.qsize(),
+            "active": len(self._active),
+            "generated": self.generated,
+            "cache_hits": self.cache_hits,
+            "failed": self.failed,
+        }
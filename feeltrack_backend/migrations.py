@@ -0,0 +1,396 @@
+import ast
+import argparse
+import itertools
+import os
+import sys
+from typing import Optional
+import mysql.connector
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Database connection configuration
+config = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "1996"),
+}
+
+DB_NAME = os.getenv("DB_NAME", "mentalhealthdb")
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fastapi-app.py")
+
+
+# Idempotent, online schema operations
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table unless it is already there."""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (DB_NAME, table, column)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}, ALGORITHM=INPLACE, LOCK=NONE")
+
+
+def add_index_if_missing(cursor, table, index, columns):
+    """Create an index on an existing table unless it is already there."""
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (DB_NAME, table, index)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} ({columns}), ALGORITHM=INPLACE, LOCK=NONE")
+
+
+# Migrations, applied in version order. Every step must be safe to re-run,
+# since MySQL commits DDL immediately and a run can stop half way through.
+def migration_hot_path_indexes(cursor):
+    add_index_if_missing(cursor, "Messages", "idx_messages_conversation_timestamp",
+                         "conversation_id, timestamp, message_id")
+    add_index_if_missing(cursor, "Conversations", "idx_conversations_user_updated",
+                         "user_id, updated_at, conversation_id")
+    add_index_if_missing(cursor, "SupportiveMessages", "idx_supportive_user_read_created",
+                         "user_id, is_read, created_at")
+    add_index_if_missing(cursor, "SupportiveMessages", "idx_supportive_user_created",
+                         "user_id, created_at")
+
+
+def migration_scheduler_leases(cursor):
+    add_column_if_missing(cursor, "UserPreferences", "next_notification_at", "TIMESTAMP NULL")
+    add_column_if_missing(cursor, "UserPreferences", "lease_owner", "VARCHAR(100)")
+    add_column_if_missing(cursor, "UserPreferences", "lease_expires_at", "TIMESTAMP NULL")
+    add_index_if_missing(cursor, "UserPreferences", "idx_prefs_due",
+                         "notifications_enabled, next_notification_at")
+    add_index_if_missing(cursor, "UserPreferences", "idx_prefs_lease_owner", "lease_owner")
+    # Schedule everyone one interval after their last supportive message (or from now),
+    # so the first run after deploy does not message every enabled user at once
+    cursor.execute("""
+    UPDATE UserPreferences p
+    LEFT JOIN (
+        SELECT user_id, MAX(created_at) AS last_sent FROM SupportiveMessages GROUP BY user_id
+    ) sent ON sent.user_id = p.user_id
+    SET p.next_notification_at = COALESCE(sent.last_sent, NOW()) + INTERVAL p.notification_frequency MINUTE
+    WHERE p.next_notification_at IS NULL
+    """)
+
+
+def migration_conversation_summaries(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ConversationSummaries (
+        conversation_id INT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        summarized_through INT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        FOREIGN KEY (conversation_id) REFERENCES Conversations(conversation_id) ON DELETE CASCADE
+    )
+    """)
+
+
+def migration_cache_invalidations(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CacheInvalidations (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        cache_name VARCHAR(50) NOT NULL,
+        cache_key INT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_invalidations_created (created_at)
+    )
+    """)
+
+
+def migration_unread_supportive_count(cursor):
+    add_column_if_missing(cursor, "Users", "unread_supportive_count", "INT NOT NULL DEFAULT 0")
+    # Backfill from the messages; recomputing makes a re-run safe
+    cursor.execute("""
+    UPDATE Users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS unread FROM SupportiveMessages WHERE is_read = FALSE GROUP BY user_id
+    ) counts ON counts.user_id = u.user_id
+    SET u.unread_supportive_count = COALESCE(counts.unread, 0)
+    """)
+
+
+def migration_check_ins(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CheckIns (
+        check_in_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        emotion VARCHAR(20) NOT NULL,
+        mood_score TINYINT NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+        INDEX idx_checkins_user_created (user_id, created_at)
+    )
+    """)
+    # Rollups maintained by the app on every check-in
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CheckInDailyRollups (
+        user_id INT NOT NULL,
+        day DATE NOT NULL,
+        check_ins INT NOT NULL,
+        mood_total INT NOT NULL,
+        PRIMARY KEY (user_id, day),
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CheckInWeeklyEmotions (
+        user_id INT NOT NULL,
+        week_start DATE NOT NULL,
+        emotion VARCHAR(20) NOT NULL,
+        check_ins INT NOT NULL,
+        PRIMARY KEY (user_id, week_start, emotion),
+        FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+    )
+    """)
+
+
+def migration_messages_archive(cursor):
+    # Same columns as Messages; compressed pages since archived rows are rarely read
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS MessagesArchive (
+        message_id INT PRIMARY KEY,
+        conversation_id INT NOT NULL,
+        is_user BOOLEAN NOT NULL,
+        content TEXT NOT NULL,
+        positive_reframe TEXT,
+        timestamp TIMESTAMP NULL,
+        FOREIGN KEY (conversation_id) REFERENCES Conversations(conversation_id) ON DELETE CASCADE,
+        INDEX idx_archive_conversation_timestamp (conversation_id, timestamp, message_id)
+    ) ROW_FORMAT=COMPRESSED
+    """)
+    # Lets the archiver find idle conversations without scanning
+    add_index_if_missing(cursor, "Conversations", "idx_conversations_updated", "updated_at")
+
+
+MIGRATIONS = [
+    (1, "hot path indexes", migration_hot_path_indexes),
+    (2, "scheduler leases", migration_scheduler_leases),
+    (3, "conversation summaries", migration_conversation_summaries),
+    (4, "cache invalidations", migration_cache_invalidations),
+    (5, "unread supportive message count", migration_unread_supportive_count),
+    (6, "check-ins and rollups", migration_check_ins),
+    (7, "messages archive", migration_messages_archive),
+]
+
+
+def get_applied_versions(cursor):
+    """Get the set of migration versions already recorded in the database."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS SchemaMigrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT version FROM SchemaMigrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_migrations(conn):
+    """Apply every pending migration, holding a named lock so only one runner is active."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK('feeltrack_migrations', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Another migration run is in progress")
+        try:
+            applied = get_applied_versions(cursor)
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"Applying migration {version}: {name}")
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('feeltrack_migrations')")
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+# Query plan check
+class _Unresolved(Exception):
+    """Raised when part of a query is only known at runtime."""
+
+
+def _sql_names(node):
+    """Names a SQL expression's text depends on (not its parameters)."""
+    if isinstance(node, ast.Name):
+        return {node.id}
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "with_archive":
+        return _sql_names(node.args[0]) | _sql_names(node.args[2])
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+        # ", ".join(["%s"] * len(ids)): one placeholder is enough for a plan
+        return _sql_names(node.left)
+    return set().union(*(_sql_names(child) for child in ast.iter_child_nodes(node)))
+
+
+def _evaluate(node, env, with_archive):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in env:
+        return env[node.id]
+    if isinstance(node, ast.JoinedStr):
+        return "".join(str(_evaluate(part.value if isinstance(part, ast.FormattedValue) else part, env, with_archive))
+                       for part in node.values)
+    if isinstance(node, ast.List):
+        return [_evaluate(item, env, with_archive) for item in node.elts]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+        return _evaluate(node.left, env, with_archive)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return _evaluate(node.left, env, with_archive) + _evaluate(node.right, env, with_archive)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "join"
+            and isinstance(node.func.value, ast.Constant) and len(node.args) == 1):
+        return node.func.value.value.join(_evaluate(node.args[0], env, with_archive))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "with_archive"
+            and with_archive is not None and len(node.args) >= 3):
+        limit = 1 if len(node.args) > 3 or any(k.arg == "limit" for k in node.keywords) else None
+        sql, _ = with_archive(_evaluate(node.args[0], env, with_archive), (),
+                              _evaluate(node.args[2], env, with_archive), limit)
+        return sql
+    raise _Unresolved()
+
+
+def _values(node, func, constants, with_archive, depth=0):
+    """Every value a SQL expression can take, binding each name it uses to the
+    literals assigned to it in the enclosing function (or at module level)."""
+    names = sorted(_sql_names(node))
+    choices = []
+    for name in names:
+        if name in constants:
+            choices.append([constants[name]])
+        else:
+            choices.append(_local_values(func, name, constants, with_archive, depth))
+    return [_evaluate(node, dict(zip(names, combo)), with_archive) for combo in itertools.product(*choices)]
+
+
+def _local_values(func, name, constants, with_archive, depth):
+    if func is None or depth > 3:
+        raise _Unresolved()
+    values, appended = [], []
+    for node in ast.walk(func):
+        if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name) and node.target.id == name:
+            raise _Unresolved()
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            values += _values(node.value, func, constants, with_archive, depth + 1)
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "append"
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == name and node.args):
+            appended += _values(node.args[0], func, constants, with_archive, depth + 1)
+    if not values:
+        raise _Unresolved()
+    if appended:
+        # Conditions added under an `if`: check the base list alone and with each one
+        values = [base + extra for base in values if isinstance(base, list)
+                  for extra in [[]] + [[item] for item in appended]]
+    return values
+
+
+def _load_with_archive(tree):
+    """The app's own with_archive() builder, so the checked SQL cannot drift from it."""
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "with_archive":
+            namespace = {"Optional": Optional}
+            exec(compile(ast.Module(body=[node], type_ignores=[]), APP_FILE, "exec"), namespace)
+            return namespace["with_archive"]
+    return None
+
+
+def find_app_queries(path=APP_FILE):
+    """Find the SQL passed to cursor.execute() in the app, with line numbers.
+
+    f-strings, local query variables and with_archive() calls are expanded from
+    the literals they are built from, one query per variant. Returns the queries
+    and the call sites whose text is only known at runtime, which are not checked.
+    """
+    with open(path) as f:
+        source = f.read()
+    tree = ast.parse(source)
+
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                continue
+            if isinstance(value, str):
+                constants[node.targets[0].id] = value
+    with_archive = _load_with_archive(tree)
+
+    queries, skipped = set(), []
+
+    def visit(node, func):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            func = node
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "execute" and node.args):
+            arg = node.args[0]
+            if isinstance(arg, ast.Starred):
+                arg = arg.value
+            if (isinstance(arg, ast.Name) and func is not None and func.name == "execute"
+                    and arg.id in [a.arg for a in func.args.args]):
+                # A pass-through wrapper; its callers are checked instead
+                arg = None
+            if arg is not None:
+                try:
+                    variants = _values(arg, func, constants, with_archive)
+                except _Unresolved:
+                    skipped.append((node.lineno, ast.get_source_segment(source, arg).split("\n")[0]))
+                    variants = []
+                for sql in variants:
+                    sql = " ".join(sql.split())
+                    if sql.lstrip("( ").split(" ", 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+                        queries.add((node.lineno, sql))
+        for child in ast.iter_child_nodes(node):
+            visit(child, func)
+
+    visit(tree, None)
+    return sorted(queries), sorted(skipped)
+
+
+def explain_queries(conn, queries):
+    """EXPLAIN each query and return the ones whose plan contains a full table scan."""
+    cursor = conn.cursor(dictionary=True)
+    flagged = []
+    try:
+        for lineno, sql in queries:
+            # Placeholder values only need to type-check; the plan is what matters
+            cursor.execute("EXPLAIN " + sql.replace("%s", "1"))
+            for row in cursor.fetchall():
+                if row.get("type") == "ALL":
+                    flagged.append((lineno, row.get("table"), sql))
+    finally:
+        cursor.close()
+    return flagged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--explain", action="store_true",
+                        help="check the app's queries for full table scans instead of migrating")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(database=DB_NAME, **config)
+    try:
+        if args.explain:
+            queries, skipped = find_app_queries()
+            flagged = explain_queries(conn, queries)
+            for lineno, table, sql in flagged:
+                print(f"fastapi-app.py:{lineno}: full scan of {table}: {sql}")
+            for lineno, expression in skipped:
+                print(f"fastapi-app.py:{lineno}: not checked, SQL is built at runtime: {expression}")
+            if flagged:
+                sys.exit(1)
+            print("No full table scans found")
+        else:
+            run_migrations(conn)
+            print("Migrations up to date")
+    finally:
+        conn.close()
@@ -0,0 +1,11 @@
+from passlib.context import CryptContext
+
+
+def make_password_context(bcrypt_rounds: int = 12) -> CryptContext:
+    """Password hashing: bcrypt for new hashes, legacy unsalted SHA-256 hashes are
+    still accepted and flagged for upgrade to bcrypt by verify_and_update()."""
+    return CryptContext(
+        schemes=["bcrypt", "hex_sha256"],
+        deprecated=["hex_sha256"],
+        bcrypt__rounds=bcrypt_rounds,
+    )
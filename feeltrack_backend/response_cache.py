@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import string
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalise user text so trivially different inputs share a cache entry."""
+    return " ".join(text.casefold().split()).strip(string.punctuation + " ")
+
+
+def make_cache_key(template: str, model: str, text: str) -> str:
+    """Build a cache key from the prompt template name, model and normalised input."""
+    raw = f"{model}\x00{template}\x00{normalize_prompt(text)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class LRUCache:
+    """Bounded in-process cache with least-recently-used eviction and a TTL."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """In-process cache for LLM responses with single-flight request coalescing.
+
+    Values stay in this worker's memory and are never written to disk, since
+    they are derived from users' own words. Concurrent misses for the same key
+    share one call to the loader. Failed loads are not cached, so callers can
+    still apply their own fallback.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.local = LRUCache(max_size, ttl)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: str, loader):
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            self.misses += 1
+            value = await loader()
+            if value:
+                self.local.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Only waiters should see the error; avoid "exception never retrieved" warnings
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def stats(self):
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.local),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": (lookups - self.misses) / lookups if lookups else 0.0,
+        }
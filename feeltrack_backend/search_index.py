@@ -0,0 +1,228 @@
+import fcntl
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+from response_cache import LRUCache
+
+WORD_RE = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by do for from had has have he her his i if in is it its me my "
+    "no not of on or our so that the their them then there they this to too was we were what "
+    "when which who will with you your".split()
+)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal rank fusion constant; damps the weight of the very top ranks
+RRF_K = 60
+
+
+def tokenize(text: str):
+    """Split text into lower-cased keywords, dropping stopwords and single letters."""
+    return [word for word in WORD_RE.findall(text.casefold()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, limit: int):
+    """Merge ranked lists of IDs into one ranking of (id, score)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return heapq.nlargest(limit, scores.items(), key=lambda entry: entry[1])
+
+
+class UserIndex:
+    """Append-only keyword and embedding index over one user's messages.
+
+    Files in the user's directory:
+      messages.jsonl   one JSON line per message (id, conversation, text, time)
+      ids.i64          message IDs of the embedded messages
+      vectors-<dim>.f32  unit-length embeddings, row i belongs to ids[i]
+
+    Writers append under an exclusive file lock, so several workers can share
+    the directory. Readers memory-map the vectors and keep the inverted
+    keyword index in memory, catching up on whatever was appended since the
+    last search, and drop it once the directory has been removed.
+    """
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.messages_path = os.path.join(directory, "messages.jsonl")
+        self.ids_path = os.path.join(directory, "ids.i64")
+        self.vectors_path = os.path.join(directory, f"vectors-{dim}.f32")
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._messages_offset = 0
+        self._vector_count = 0
+        self._ids = None
+        self._vectors = None
+        self.messages = {}
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+
+    @contextmanager
+    def _file_lock(self):
+        # Holds the user's own words, so only the app's account may read it
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stored_vector_count(self):
+        ids = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        vectors = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        return min(ids, vectors)
+
+    def append(self, message: dict, vector=None):
+        """Add a message and, when available, its embedding."""
+        line = json.dumps(message, default=str) + "\n"
+        with self._file_lock():
+            with open(self.messages_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if vector is None:
+                return
+            vector = np.asarray(vector, dtype="<f4")
+            if vector.shape != (self.dim,):
+                raise ValueError(f"Expected a {self.dim}-dimensional embedding, got {vector.shape}")
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+            # Cut off a half-written record left by a crashed writer so the files stay aligned
+            count = self._stored_vector_count()
+            for path, size in ((self.ids_path, 8 * count), (self.vectors_path, 4 * self.dim * count)):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+            with open(self.ids_path, "ab") as f:
+                f.write(np.array([message["message_id"]], dtype="<i8").tobytes())
+            with open(self.vectors_path, "ab") as f:
+                f.write(vector.tobytes())
+
+    def _add_message(self, message):
+        message_id = message["message_id"]
+        if message_id in self.messages:
+            return
+        self.messages[message_id] = message
+        words = tokenize(message["content"])
+        self.lengths[message_id] = len(words)
+        self.total_length += len(words)
+        for word in words:
+            postings = self.postings.setdefault(word, {})
+            postings[message_id] = postings.get(message_id, 0) + 1
+
+    def _refresh(self):
+        if self._messages_offset and not os.path.exists(self.messages_path):
+            # Removed by another worker
+            self._reset()
+        if os.path.exists(self.messages_path):
+            with open(self.messages_path, "rb") as f:
+                f.seek(self._messages_offset)
+                data = f.read()
+            # A line still being written is picked up next time
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                self._add_message(json.loads(line))
+            self._messages_offset += end
+
+        count = self._stored_vector_count()
+        if count != self._vector_count:
+            self._ids = np.memmap(self.ids_path, dtype="<i8", mode="r", shape=(count,))
+            self._vectors = np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(count, self.dim))
+            self._vector_count = count
+
+    def _keyword_ranking(self, query: str, limit: int):
+        if not self.messages:
+            return []
+        count = len(self.messages)
+        average_length = self.total_length / count or 1
+        scores = {}
+        for word in set(tokenize(query)):
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for message_id, frequency in postings.items():
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[message_id] / average_length
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                scores[message_id] = scores.get(message_id, 0.0) + score
+        return [message_id for message_id, _ in heapq.nlargest(limit, scores.items(), key=lambda e: e[1])]
+
+    def _vector_ranking(self, query_vector, limit: int):
+        if query_vector is None or not self._vector_count:
+            return []
+        query = np.asarray(query_vector, dtype="<f4")
+        norm = np.linalg.norm(query)
+        if not norm:
+            return []
+        scores = self._vectors @ (query / norm)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [int(message_id) for message_id in self._ids[top]]
+
+    def search(self, query: str, query_vector=None, limit: int = 10):
+        """Rank messages by keyword (BM25) and embedding similarity, fused by rank."""
+        with self._lock:
+            self._refresh()
+            candidates = max(limit * 5, 50)
+            rankings = [self._keyword_ranking(query, candidates),
+                        self._vector_ranking(query_vector, candidates)]
+            return [dict(self.messages[message_id], score=round(score, 6))
+                    for message_id, score in reciprocal_rank_fusion(rankings, limit)
+                    if message_id in self.messages]
+
+
+class SearchIndex:
+    """Per-user search indexes under one directory, keeping recently searched users loaded."""
+
+    def __init__(self, root: str, dim: int, max_loaded: int = 256):
+        self.root = root
+        self.dim = dim
+        self._loaded = LRUCache(max_loaded, float("inf"))
+        self._lock = threading.Lock()
+
+    def user(self, user_id: int) -> UserIndex:
+        with self._lock:
+            index = self._loaded.get(user_id)
+            if index is None:
+                index = UserIndex(os.path.join(self.root, str(user_id)), self.dim)
+                self._loaded.set(user_id, index)
+            return index
+
+    def append(self, user_id: int, message: dict, vector=None):
+        self.user(user_id).append(message, vector)
+
+    def search(self, user_id: int, query: str, query_vector=None, limit: int = 10):
+        return self.user(user_id).search(query, query_vector, limit)
+
+    def user_ids(self):
+        """IDs of the users that have an index on disk."""
+        if not os.path.isdir(self.root):
+            return []
+        return [int(name) for name in os.listdir(self.root) if name.isdigit()]
+
+    def remove_user(self, user_id: int):
+        """Delete a user's index from disk and memory."""
+        with self._lock:
+            index = self._loaded.get(user_id)
+            self._loaded.invalidate(user_id)
+        if index is not None:
+            with index._lock:
+                index._reset()
+        shutil.rmtree(os.path.join(self.root, str(user_id)), ignore_errors=True)
+
+    def stats(self):
+        return {"loaded_users": len(self._loaded)}
@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("dotenv")
+
+from migrations import find_app_queries
+
+queries, skipped = find_app_queries()
+
+
+def test_with_archive_queries_are_expanded():
+    archive_queries = [sql for _, sql in queries if "UNION ALL" in sql]
+    assert archive_queries
+    assert all("FROM MessagesArchive" in sql for sql in archive_queries)
+
+
+def test_fstring_conditions_are_expanded():
+    pages = [sql for _, sql in queries if sql.startswith("SELECT conversation_id, title")]
+    assert any("updated_at < %s" in sql for sql in pages)
+    assert any("updated_at > %s" in sql for sql in pages)
+    assert not any("{" in sql for _, sql in queries)
+
+
+def test_runtime_sql_is_reported():
+    assert any("self.table" in expression for _, expression in skipped)
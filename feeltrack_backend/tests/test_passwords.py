@@ -0,0 +1,25 @@
+import hashlib
+
+from passwords import make_password_context
+
+pwd_context = make_password_context(bcrypt_rounds=4)
+
+
+def test_hash_and_verify():
+    password_hash = pwd_context.hash("correct horse battery staple")
+    assert password_hash.startswith("$2b$")
+    assert pwd_context.verify_and_update("correct horse battery staple", password_hash) == (True, None)
+    assert pwd_context.verify_and_update("wrong password", password_hash) == (False, None)
+
+
+def test_legacy_sha256_hash_is_upgraded():
+    legacy_hash = hashlib.sha256(b"old password").hexdigest()
+    valid, new_hash = pwd_context.verify_and_update("old password", legacy_hash)
+    assert valid
+    assert new_hash.startswith("$2b$")
+    assert pwd_context.verify("old password", new_hash)
+
+
+def test_long_password_does_not_raise():
+    password_hash = pwd_context.hash("x" * 100)
+    assert pwd_context.verify("x" * 100, password_hash)
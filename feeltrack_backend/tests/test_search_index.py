@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from search_index import SearchIndex
+
+
+def message(message_id, content):
+    return {"message_id": message_id, "conversation_id": 1, "is_user": True,
+            "content": content, "timestamp": "2024-01-01 00:00:00"}
+
+
+def test_search_by_keyword(tmp_path):
+    index = SearchIndex(str(tmp_path), dim=4)
+    index.append(7, message(1, "I can't sleep tonight"))
+    index.append(7, message(2, "work was busy"))
+    results = index.search(7, "sleep")
+    assert [result["message_id"] for result in results] == [1]
+
+
+def test_remove_user_deletes_index(tmp_path):
+    index = SearchIndex(str(tmp_path), dim=4)
+    index.append(7, message(1, "I can't sleep tonight"), [1, 0, 0, 0])
+    index.append(8, message(2, "work was busy"))
+    assert index.search(7, "sleep")
+    assert sorted(index.user_ids()) == [7, 8]
+
+    index.remove_user(7)
+    assert index.user_ids() == [8]
+    assert not os.path.exists(tmp_path / "7")
+    assert index.search(7, "sleep") == []
+
+
+def test_removal_by_another_worker_drops_loaded_index(tmp_path):
+    index = SearchIndex(str(tmp_path), dim=4)
+    other_worker = SearchIndex(str(tmp_path), dim=4)
+    index.append(7, message(1, "I can't sleep tonight"))
+    assert other_worker.search(7, "sleep")
+
+    index.remove_user(7)
+    assert other_worker.search(7, "sleep") == []
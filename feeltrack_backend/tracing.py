@@ -0,0 +1,266 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a fast indexed query up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry["counts"][i] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, entry in self.values.items():
+            for bound, count in zip(self.buckets, entry["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {entry['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {entry['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {entry['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal Prometheus-style registry; updates may come from executor threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._gauge_callbacks = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(self, callback):
+        """Register a callback returning {metric_name: value} to sample at scrape time."""
+        self._gauge_callbacks.append(callback)
+
+    def inc(self, counter: Counter, amount: float = 1, **labels):
+        with self._lock:
+            counter.inc(amount, **labels)
+
+    def observe(self, histogram: Histogram, value: float, **labels):
+        with self._lock:
+            histogram.observe(value, **labels)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        for callback in self._gauge_callbacks:
+            for name, value in callback().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+request_duration = registry.histogram(
+    "feeltrack_http_request_duration_seconds", "HTTP request latency by endpoint")
+requests_total = registry.counter(
+    "feeltrack_http_requests_total", "HTTP requests by endpoint and status")
+span_duration = registry.histogram(
+    "feeltrack_span_duration_seconds", "Duration of database and LLM spans")
+db_rows = registry.counter(
+    "feeltrack_db_rows_total", "Rows returned by database helpers")
+llm_tokens = registry.counter(
+    "feeltrack_llm_tokens_total", "Estimated prompt and response tokens sent to and received from Gemini")
+llm_calls = registry.counter(
+    "feeltrack_llm_calls_total", "Gemini calls by operation and outcome")
+
+
+# Traces
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans recorded while serving one request."""
+
+    def __init__(self, name: str):
+        self.trace_id = os.urandom(16).hex()
+        self.root_id = os.urandom(8).hex()
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.spans = []
+
+    def add_span(self, name, kind, start_ns, end_ns, attributes):
+        self.spans.append({
+            "span_id": os.urandom(8).hex(),
+            "name": name,
+            "kind": kind,
+            "start_ns": start_ns,
+            "end_ns": end_ns,
+            "attributes": attributes,
+        })
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes):
+    """Time a block as a span of the current trace and in the span histogram.
+
+    The yielded dict can be filled with attributes (row counts, token counts)
+    while the block runs.
+    """
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        registry.observe(span_duration, duration, kind=kind, name=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(name, kind, start_ns, time.time_ns(), attributes)
+
+
+def record_span(name: str, kind: str, seconds: float, attributes: dict):
+    """Record a span that has already finished, e.g. one reported by a callback."""
+    registry.observe(span_duration, seconds, kind=kind, name=name)
+    trace = current_trace.get()
+    if trace is not None:
+        end_ns = time.time_ns()
+        trace.add_span(name, kind, end_ns - int(seconds * 1e9), end_ns, attributes)
+
+
+def count_rows(result) -> int:
+    """Best-effort row count for a database helper's return value."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    return 0
+
+
+# OpenTelemetry-compatible file export (OTLP/JSON, one trace per line)
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class FileSpanExporter:
+    """Writes finished traces as OTLP/JSON lines from a background thread.
+
+    The output can be read by the OpenTelemetry Collector's file receiver or
+    loaded into any tool that understands OTLP/JSON.
+    """
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.service_name = service_name
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+
+    def start(self):
+        """Start the writer thread. Called per worker, since threads do not survive a fork."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+            self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            pass  # Drop traces rather than slow down requests
+
+    def _to_otlp(self, trace: Trace):
+        spans = [{
+            "traceId": trace.trace_id,
+            "spanId": trace.root_id,
+            "name": trace.name,
+            "kind": 2,  # SERVER
+            "startTimeUnixNano": str(trace.start_ns),
+            "endTimeUnixNano": str(trace.end_ns),
+            "attributes": _otlp_attributes(trace.attributes),
+        }]
+        for s in trace.spans:
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": s["span_id"],
+                "parentSpanId": trace.root_id,
+                "name": s["name"],
+                "kind": 3,  # CLIENT
+                "startTimeUnixNano": str(s["start_ns"]),
+                "endTimeUnixNano": str(s["end_ns"]),
+                "attributes": _otlp_attributes({"span.kind": s["kind"], **s["attributes"]}),
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "feeltrack"}, "spans": spans}],
+        }]}
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                trace = self._queue.get()
+                f.write(json.dumps(self._to_otlp(trace)) + "\n")
+                if self._queue.empty():
+                    f.flush()